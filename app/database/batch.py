@@ -0,0 +1,110 @@
+import asyncio
+import contextvars
+import logging
+from contextlib import suppress
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from config import BATCH_MAX_SIZE, BATCH_INTERVAL_MS, BATCH_QUEUE_SIZE
+from app.database.models import AsyncSessionLocal
+
+_writers: List["BatchWriter"] = []
+
+
+class BatchWriter:
+    # Фоновая запись append-only строк: add() кладёт строку в ограниченную
+    # очередь и сразу возвращается, фоновая задача пишет накопленное одним
+    # многострочным INSERT каждые max_size строк или interval_ms миллисекунд.
+    # При переполнении очереди строки отбрасываются с предупреждением —
+    # хендлер никогда не ждёт записи.
+    # on_flush(session, rows) вызывается после вставки в той же транзакции —
+    # например, чтобы пополнить сводные счётчики по записанным строкам.
+    def __init__(
+        self,
+        model,
+        session_pool: async_sessionmaker[AsyncSession] = AsyncSessionLocal,
+        max_size: int = BATCH_MAX_SIZE,
+        interval_ms: int = BATCH_INTERVAL_MS,
+        queue_size: int = BATCH_QUEUE_SIZE,
+        on_flush: Optional[Callable[[AsyncSession, List[Dict[str, Any]]], Awaitable[None]]] = None,
+    ):
+        self.model = model
+        self.on_flush = on_flush
+        self.session_pool = session_pool
+        self.max_size = max_size
+        self.interval = interval_ms / 1000
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._batch: List[Dict[str, Any]] = []
+        self._task: Optional[asyncio.Task] = None
+        self.dropped = 0
+        _writers.append(self)
+
+    def add(self, row: Dict[str, Any]):
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logging.warning(f"{self.model.__tablename__}: write queue is full, {self.dropped} rows dropped so far")
+            return
+        if self._task is None or self._task.done():
+            # Чистый контекст: иначе задача унаследует счётчик запросов апдейта,
+            # который её запустил, и будет пополнять его до конца работы процесса
+            self._task = asyncio.create_task(self._run(), context=contextvars.Context())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._collect(None)
+            deadline = loop.time() + self.interval
+            while len(self._batch) < self.max_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0 or not await self._collect(timeout):
+                    break
+            rows, self._batch = self._batch, []
+            await self._write(rows)
+
+    async def _collect(self, timeout: Optional[float]) -> bool:
+        # asyncio.wait вместо wait_for: до Python 3.12 wait_for теряет отмену,
+        # если строка пришла одновременно с ней, и close() ждёт вечно.
+        # Уже снятая с очереди строка не теряется и при отмене.
+        getter = asyncio.ensure_future(self._queue.get())
+        try:
+            await asyncio.wait({getter}, timeout=timeout)
+        finally:
+            received = getter.done() and not getter.cancelled()
+            if received:
+                self._batch.append(getter.result())
+            else:
+                getter.cancel()
+        return received
+
+    async def _write(self, rows: List[Dict[str, Any]]):
+        try:
+            async with self.session_pool() as session:
+                await session.execute(insert(self.model), rows)
+                if self.on_flush is not None:
+                    await self.on_flush(session, rows)
+                await session.commit()
+        except asyncio.CancelledError:
+            # Остановка во время записи: close() допишет эти строки
+            self._batch = rows + self._batch
+            raise
+        except Exception as e:
+            logging.error(f"Ошибка пакетной записи в {self.model.__tablename__} ({len(rows)} строк): {e}")
+
+    async def close(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+        rows, self._batch = self._batch, []
+        while not self._queue.empty():
+            rows.append(self._queue.get_nowait())
+        for start in range(0, len(rows), self.max_size):
+            await self._write(rows[start:start + self.max_size])
+
+
+async def close_writers():
+    # Вызывается при остановке бота: дописывает всё, что осталось в очередях
+    for writer in _writers:
+        await writer.close()
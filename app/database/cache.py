@@ -0,0 +1,312 @@
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, Union
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import USER_CACHE_TTL, USER_CACHE_SIZE, CONTENT_CACHE_TTL
+from app.database.models import User, Module, Lesson, TestQuestion
+
+
+# Неизменяемые снимки контента: хендлеры читают те же атрибуты, что и у ORM-моделей,
+# но снимки не привязаны к сессии и их можно безопасно держать между апдейтами.
+@dataclass(frozen=True)
+class ModuleSnapshot:
+    id: int
+    code: str
+    text: str
+    photo: str
+    photo_file_id: Optional[str]
+
+
+@dataclass(frozen=True)
+class LessonSnapshot:
+    id: int
+    code: str
+    module_id: int
+    position: int
+    text: str
+    photo: str
+    photo_file_id: Optional[str]
+    video_link: str
+    notes_link: str
+
+
+@dataclass(frozen=True)
+class QuestionSnapshot:
+    id: int
+    lesson_code: str
+    question_text: str
+    option_1: str
+    option_2: str
+    option_3: Optional[str]
+    correct_option: int
+    photo: str
+    photo_file_id: Optional[str]
+    # Снимки в FSM, сохранённые до появления версий, относятся к версии 0
+    version: int = 0
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    id: int
+    first_name: str
+    last_name: str
+    username: str
+    is_admin: bool
+
+
+def _module_snapshot(module: Module) -> ModuleSnapshot:
+    return ModuleSnapshot(
+        id=module.id, code=module.code, text=module.text,
+        photo=module.photo, photo_file_id=module.photo_file_id
+    )
+
+
+def _lesson_snapshot(lesson: Lesson) -> LessonSnapshot:
+    return LessonSnapshot(
+        id=lesson.id, code=lesson.code, module_id=lesson.module_id, position=lesson.position, text=lesson.text,
+        photo=lesson.photo, photo_file_id=lesson.photo_file_id,
+        video_link=lesson.video_link, notes_link=lesson.notes_link
+    )
+
+
+def _question_snapshot(question: TestQuestion) -> QuestionSnapshot:
+    return QuestionSnapshot(
+        id=question.id, lesson_code=question.lesson_code, question_text=question.question_text,
+        option_1=question.option_1, option_2=question.option_2, option_3=question.option_3,
+        correct_option=question.correct_option, photo=question.photo,
+        photo_file_id=question.photo_file_id, version=question.version
+    )
+
+
+def _user_snapshot(user: User) -> UserSnapshot:
+    return UserSnapshot(
+        id=user.id, first_name=user.first_name, last_name=user.last_name,
+        username=user.username, is_admin=user.is_admin
+    )
+
+
+class ContentCache:
+    # Изменения контента из этого процесса сбрасывают кэш сразу, изменения из
+    # других экземпляров бота становятся видны не позже чем через ttl секунд:
+    # по истечении ttl кэш очищается целиком и загружается заново.
+    def __init__(self, ttl: float = CONTENT_CACHE_TTL):
+        self.ttl = ttl
+        self._expires_at = time.monotonic() + ttl
+        self._modules: Optional[Tuple[ModuleSnapshot, ...]] = None
+        self._modules_by_code: Dict[str, ModuleSnapshot] = {}
+        self._lessons_by_module: Dict[str, Tuple[LessonSnapshot, ...]] = {}
+        self._lessons: Dict[str, LessonSnapshot] = {}
+        self._questions: Dict[str, Tuple[QuestionSnapshot, ...]] = {}
+        # Готовые InlineKeyboardMarkup навигации по модулям и урокам; строятся
+        # из снимков выше и сбрасываются вместе с ними
+        self._keyboards: Dict[Hashable, Any] = {}
+        # Счётчик инвалидаций: загрузка, начатая до инвалидации, не должна
+        # записать в кэш устаревший снимок.
+        self._generation = 0
+
+    def _expire(self):
+        now = time.monotonic()
+        if now >= self._expires_at:
+            self.clear()
+            self._expires_at = now + self.ttl
+
+    async def _load_modules(self, session: AsyncSession) -> Tuple[Tuple[ModuleSnapshot, ...], Dict[str, ModuleSnapshot]]:
+        self._expire()
+        if self._modules is None:
+            generation = self._generation
+            result = await session.execute(select(Module).order_by(Module.id))
+            modules = tuple(_module_snapshot(m) for m in result.scalars().all())
+            modules_by_code = {m.code: m for m in modules}
+            if generation != self._generation:
+                # Кэш сбросили во время загрузки: отдаём загруженное, но не сохраняем
+                return modules, modules_by_code
+            self._modules = modules
+            self._modules_by_code = modules_by_code
+        return self._modules, self._modules_by_code
+
+    async def get_modules(self, session: AsyncSession) -> Tuple[ModuleSnapshot, ...]:
+        modules, _ = await self._load_modules(session)
+        return modules
+
+    async def get_module(self, session: AsyncSession, code: str) -> Optional[ModuleSnapshot]:
+        _, modules_by_code = await self._load_modules(session)
+        return modules_by_code.get(code)
+
+    async def get_lessons(self, session: AsyncSession, module_code: str) -> Tuple[LessonSnapshot, ...]:
+        self._expire()
+        lessons = self._lessons_by_module.get(module_code)
+        if lessons is None:
+            generation = self._generation
+            result = await session.execute(
+                select(Lesson).join(Module).where(Module.code == module_code).order_by(Lesson.position, Lesson.id)
+            )
+            lessons = tuple(_lesson_snapshot(l) for l in result.scalars().all())
+            if generation == self._generation:
+                self._lessons_by_module[module_code] = lessons
+                for lesson in lessons:
+                    self._lessons[lesson.code] = lesson
+        return lessons
+
+    async def get_lesson(self, session: AsyncSession, code: str) -> Optional[LessonSnapshot]:
+        self._expire()
+        lesson = self._lessons.get(code)
+        if lesson is None:
+            generation = self._generation
+            result = await session.execute(select(Lesson).where(Lesson.code == code))
+            row = result.scalars().first()
+            if row is None:
+                return None
+            lesson = _lesson_snapshot(row)
+            if generation == self._generation:
+                self._lessons[code] = lesson
+        return lesson
+
+    async def get_questions(self, session: AsyncSession, lesson_code: str) -> Tuple[QuestionSnapshot, ...]:
+        self._expire()
+        questions = self._questions.get(lesson_code)
+        if questions is None:
+            generation = self._generation
+            result = await session.execute(
+                select(TestQuestion).where(TestQuestion.lesson_code == lesson_code).order_by(TestQuestion.position, TestQuestion.id)
+            )
+            questions = tuple(_question_snapshot(q) for q in result.scalars().all())
+            if generation == self._generation:
+                self._questions[lesson_code] = questions
+        return questions
+
+    async def get_keyboard(self, key: Hashable, build: Callable[..., Awaitable[Any]], *args) -> Any:
+        self._expire()
+        keyboard = self._keyboards.get(key)
+        if keyboard is None:
+            generation = self._generation
+            keyboard = await build(*args)
+            if generation == self._generation:
+                self._keyboards[key] = keyboard
+        return keyboard
+
+    def set_photo_file_id(self, item: Union[ModuleSnapshot, LessonSnapshot, QuestionSnapshot], file_id: str):
+        # Точечно обновляет один снимок вместо сброса кэша: file_id не влияет
+        # ни на порядок, ни на клавиатуры. Снимок заменяется, только если в
+        # кэше всё ещё та же версия, что была отправлена.
+        updated = replace(item, photo_file_id=file_id)
+
+        def swap(snapshots):
+            return tuple(updated if s == item else s for s in snapshots)
+
+        if isinstance(item, ModuleSnapshot):
+            if self._modules is not None:
+                self._modules = swap(self._modules)
+                self._modules_by_code = {m.code: m for m in self._modules}
+        elif isinstance(item, LessonSnapshot):
+            if self._lessons.get(item.code) == item:
+                self._lessons[item.code] = updated
+            for module_code, lessons in self._lessons_by_module.items():
+                if item in lessons:
+                    self._lessons_by_module[module_code] = swap(lessons)
+        else:
+            questions = self._questions.get(item.lesson_code)
+            if questions is not None:
+                self._questions[item.lesson_code] = swap(questions)
+
+    def invalidate_modules(self):
+        self._generation += 1
+        self._keyboards.clear()
+        self._modules = None
+        self._modules_by_code = {}
+
+    def invalidate_lesson(self, code: str):
+        self._generation += 1
+        self._keyboards.clear()
+        self._lessons.pop(code, None)
+        # Код модуля не всегда однозначно выводится из кода урока, поэтому
+        # сбрасываем списки уроков целиком — изменения контента редки.
+        self._lessons_by_module.clear()
+
+    def invalidate_questions(self, lesson_code: Optional[str] = None):
+        self._generation += 1
+        if lesson_code is None:
+            self._questions.clear()
+        else:
+            self._questions.pop(lesson_code, None)
+
+    def clear(self):
+        self._generation += 1
+        self._modules = None
+        self._modules_by_code = {}
+        self._lessons_by_module.clear()
+        self._lessons.clear()
+        self._questions.clear()
+        self._keyboards.clear()
+
+
+content_cache = ContentCache()
+
+
+class UserCache:
+    # Пользователи и их роли с ограниченным временем жизни. Изменения из этого
+    # процесса сбрасывают запись сразу, изменения из других экземпляров бота
+    # становятся видны не позже чем через ttl секунд. Отсутствующие пользователи
+    # не кэшируются: регистрация в другом процессе должна быть видна сразу.
+    def __init__(self, ttl: float = USER_CACHE_TTL, max_size: int = USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._users: Dict[int, Tuple[float, UserSnapshot]] = {}
+        self._generation = 0
+
+    async def get_user(self, session: AsyncSession, user_id: int) -> Optional[UserSnapshot]:
+        entry = self._users.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        generation = self._generation
+        result = await session.execute(select(User).where(User.id == user_id))
+        row = result.scalars().first()
+        if row is None:
+            self._users.pop(user_id, None)
+            return None
+        user = _user_snapshot(row)
+        if self.ttl > 0 and generation == self._generation:
+            if user_id not in self._users and len(self._users) >= self.max_size:
+                # Словарь хранит порядок вставки — вытесняем самую старую запись
+                self._users.pop(next(iter(self._users)))
+            self._users[user_id] = (time.monotonic() + self.ttl, user)
+        return user
+
+    def invalidate(self, user_id: int):
+        self._generation += 1
+        self._users.pop(user_id, None)
+
+    def clear(self):
+        self._generation += 1
+        self._users.clear()
+
+
+user_cache = UserCache()
+
+
+async def get_cached_user(session: AsyncSession, user_id: int) -> Optional[UserSnapshot]:
+    return await user_cache.get_user(session, user_id)
+
+
+async def get_cached_modules(session: AsyncSession) -> Tuple[ModuleSnapshot, ...]:
+    return await content_cache.get_modules(session)
+
+
+async def get_cached_module(session: AsyncSession, code: str) -> Optional[ModuleSnapshot]:
+    return await content_cache.get_module(session, code)
+
+
+async def get_cached_lessons(session: AsyncSession, module_code: str) -> Tuple[LessonSnapshot, ...]:
+    return await content_cache.get_lessons(session, module_code)
+
+
+async def get_cached_lesson(session: AsyncSession, code: str) -> Optional[LessonSnapshot]:
+    return await content_cache.get_lesson(session, code)
+
+
+async def get_cached_questions(session: AsyncSession, lesson_code: str) -> Tuple[QuestionSnapshot, ...]:
+    return await content_cache.get_questions(session, lesson_code)
+
+
+async def get_cached_keyboard(key: Hashable, build: Callable[..., Awaitable[Any]], *args) -> Any:
+    return await content_cache.get_keyboard(key, build, *args)
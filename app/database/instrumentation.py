@@ -0,0 +1,156 @@
+import logging
+import re
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Deque, Dict, List, Optional
+from sqlalchemy import event
+from config import DB_LOG_LEVEL, DB_SLOW_QUERY_MS, DB_QUERY_STATS
+from app.database.models import engine
+
+sql_logger = logging.getLogger("app.database.sql")
+
+# Сколько последних замеров хранится на один запрос для расчёта перцентилей
+SAMPLES_PER_STATEMENT = 1000
+# Верхняя граница числа различных запросов в статистике
+MAX_FINGERPRINTS = 500
+
+
+class QueryCounter:
+    def __init__(self, parent: Optional["QueryCounter"] = None, keep_statements: bool = False):
+        self.count = 0
+        # Суммарное время выполнения запросов, секунды
+        self.elapsed = 0.0
+        # Текст запросов хранится только по запросу (для сообщения assert_max_queries)
+        self.statements: Optional[List[str]] = [] if keep_statements else None
+        # Внешний счётчик (например, на весь апдейт) видит и запросы вложенного блока
+        self.parent = parent
+
+
+_current_counter: ContextVar[Optional[QueryCounter]] = ContextVar("query_counter", default=None)
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(statement: str) -> str:
+    # Нормализует SQL: литералы и параметры заменяются на ?, списки значений
+    # любой длины сворачиваются, чтобы IN (...) и многострочные VALUES
+    # с разным числом элементов попадали в одну группу
+    sql = re.sub(r"'(?:[^']|'')*'", "?", statement)
+    # asyncpg-диалект приводит параметры к типу: $1::INTEGER, $2::TIMESTAMP WITH TIME ZONE
+    sql = re.sub(
+        r"\$\d+::(?:TIMESTAMP WITH(?:OUT)? TIME ZONE|\w+(?:\(\d+(?:,\s*\d+)?\))?(?:\[\])*)",
+        "?", sql, flags=re.IGNORECASE
+    )
+    sql = re.sub(r"\$\d+|%\(\w+\)s|\b\d+(?:\.\d+)?\b", "?", sql)
+    sql = re.sub(r"\s+", " ", sql).strip()
+    sql = re.sub(r"\(\?(?:\s*,\s*\?)+\)", "(?, ...)", sql)
+    sql = re.sub(r"(\(\?(?:, \.\.\.)?\))(?:\s*,\s*\1)+", r"\1, ...", sql)
+    return sql
+
+
+class StatementStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.samples: Deque[float] = deque(maxlen=SAMPLES_PER_STATEMENT)
+
+    def percentile(self, q: float) -> float:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+
+@dataclass(frozen=True)
+class StatementReport:
+    fingerprint: str
+    count: int
+    total_ms: float
+    p50_ms: float
+    p99_ms: float
+
+
+class QueryStats:
+    # Агрегаты по нормализованным запросам за время жизни процесса
+    def __init__(self):
+        self._statements: Dict[str, StatementStats] = {}
+        self.started_at = time.time()
+
+    def record(self, statement: str, elapsed: float):
+        key = fingerprint(statement)
+        stats = self._statements.get(key)
+        if stats is None:
+            if len(self._statements) >= MAX_FINGERPRINTS:
+                return
+            stats = self._statements[key] = StatementStats()
+        stats.count += 1
+        stats.total += elapsed
+        stats.samples.append(elapsed)
+
+    def top(self, limit: int = 10) -> List[StatementReport]:
+        # Самые дорогие запросы по суммарному времени
+        ranked = sorted(self._statements.items(), key=lambda item: item[1].total, reverse=True)
+        return [
+            StatementReport(
+                fingerprint=key, count=stats.count, total_ms=stats.total * 1000,
+                p50_ms=stats.percentile(0.5) * 1000, p99_ms=stats.percentile(0.99) * 1000,
+            )
+            for key, stats in ranked[:limit]
+        ]
+
+    def reset(self):
+        self._statements.clear()
+        self.started_at = time.time()
+
+
+query_stats = QueryStats()
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _start_query(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_started = time.perf_counter()
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_query_started", None)
+    elapsed = time.perf_counter() - started if started is not None else 0.0
+    if DB_QUERY_STATS:
+        query_stats.record(statement, elapsed)
+    # Параметры не логируются: в них персональные данные студентов
+    if DB_LOG_LEVEL == "all":
+        sql_logger.info(f"{elapsed * 1000:.1f} ms: {statement}")
+    elif DB_LOG_LEVEL == "slow" and elapsed * 1000 >= DB_SLOW_QUERY_MS:
+        sql_logger.warning(f"Slow query ({elapsed * 1000:.1f} ms): {statement}")
+    counter = _current_counter.get()
+    while counter is not None:
+        counter.count += 1
+        counter.elapsed += elapsed
+        if counter.statements is not None:
+            counter.statements.append(statement)
+        counter = counter.parent
+
+
+@contextmanager
+def count_queries(keep_statements: bool = False):
+    # Считает запросы, выполненные в текущей задаче asyncio внутри блока
+    counter = QueryCounter(parent=_current_counter.get(), keep_statements=keep_statements)
+    token = _current_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _current_counter.reset(token)
+
+
+@contextmanager
+def assert_max_queries(limit: int):
+    # Защита от N+1: падает, если блок выполнил больше запросов, чем ожидалось
+    with count_queries(keep_statements=True) as counter:
+        yield counter
+    if counter.count > limit:
+        statements = "\n".join(counter.statements)
+        raise AssertionError(f"Expected at most {limit} queries, got {counter.count}:\n{statements}")
@@ -0,0 +1,111 @@
+import asyncio
+import time
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple, Union
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import LEADERBOARD_REFRESH
+from app.database.models import UserSummary
+
+# Ключ сортировки: (-пройдено уроков, -средний %, user_id) — лучшие в начале
+RankKey = Tuple[int, Decimal, int]
+
+
+@dataclass(frozen=True)
+class LeaderboardEntry:
+    rank: int
+    user_id: int
+    completed: int
+    avg_percent: Decimal
+
+
+class Leaderboard:
+    # Рейтинг студентов в памяти процесса: ключи всех студентов лежат в
+    # отсортированном списке, место — бинарный поиск, топ — срез. Изменение
+    # результата студента — удаление и вставка в список (сдвиг памяти), на
+    # десятках тысяч студентов это микросекунды. Список строится из user_summary
+    # при первом обращении и перечитывается раз в refresh секунд, чтобы
+    # подтянуть изменения из других экземпляров бота.
+    # Студенты с одинаковыми показателями делят одно место.
+    def __init__(self, refresh: float = LEADERBOARD_REFRESH):
+        self.refresh = refresh
+        self._keys: List[RankKey] = []
+        self._by_user: Dict[int, RankKey] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        # Изменения, пришедшие во время загрузки: применяются поверх неё
+        self._pending: Optional[Dict[int, Optional[RankKey]]] = None
+
+    @staticmethod
+    def _key(user_id: int, completed: int, avg_percent: Union[int, Decimal]) -> RankKey:
+        return (-completed, -Decimal(avg_percent), user_id)
+
+    def update(self, user_id: int, completed: int, avg_percent: Union[int, Decimal]):
+        self._set(user_id, self._key(user_id, completed, avg_percent))
+
+    def remove(self, user_id: int):
+        self._set(user_id, None)
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def _set(self, user_id: int, key: Optional[RankKey]):
+        if self._pending is not None:
+            self._pending[user_id] = key
+        if self._loaded_at is None:
+            return
+        old = self._by_user.pop(user_id, None)
+        if old is not None:
+            del self._keys[bisect_left(self._keys, old)]
+        if key is not None:
+            insort(self._keys, key)
+            self._by_user[user_id] = key
+
+    def _is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh
+
+    async def _ensure_loaded(self, session: AsyncSession):
+        if self._is_fresh():
+            return
+        async with self._lock:
+            if self._is_fresh():
+                return
+            self._pending = {}
+            try:
+                result = await session.execute(
+                    select(UserSummary.user_id, UserSummary.completed, UserSummary.avg_percent)
+                )
+                by_user = {row.user_id: self._key(*row) for row in result}
+                for user_id, key in self._pending.items():
+                    if key is None:
+                        by_user.pop(user_id, None)
+                    else:
+                        by_user[user_id] = key
+            finally:
+                self._pending = None
+            self._by_user = by_user
+            self._keys = sorted(by_user.values())
+            self._loaded_at = time.monotonic()
+
+    def _entry(self, key: RankKey) -> LeaderboardEntry:
+        # Первая позиция с теми же показателями — общее место для ничьей
+        rank = bisect_left(self._keys, key[:2]) + 1
+        return LeaderboardEntry(rank=rank, user_id=key[2], completed=-key[0], avg_percent=-key[1])
+
+    async def top(self, session: AsyncSession, limit: int = 10) -> List[LeaderboardEntry]:
+        await self._ensure_loaded(session)
+        return [self._entry(key) for key in self._keys[:limit]]
+
+    async def get_rank(self, session: AsyncSession, user_id: int) -> Optional[LeaderboardEntry]:
+        await self._ensure_loaded(session)
+        key = self._by_user.get(user_id)
+        return self._entry(key) if key is not None else None
+
+    async def size(self, session: AsyncSession) -> int:
+        await self._ensure_loaded(session)
+        return len(self._keys)
+
+
+leaderboard = Leaderboard()
@@ -0,0 +1,53 @@
+import asyncio
+import contextvars
+import logging
+from contextlib import AsyncExitStack
+from typing import Optional
+from sqlalchemy import text
+from app.database.models import AsyncSessionLocal, engine, engine_settings
+from app.database.requests import sync_progress_with_content
+from app.database.cache import get_cached_modules, get_cached_lessons, get_cached_questions
+
+_reconcile_task: Optional[asyncio.Task] = None
+_reconcile_pending = False
+
+
+async def _reconcile_loop():
+    global _reconcile_pending
+    while _reconcile_pending:
+        _reconcile_pending = False
+        try:
+            async with AsyncSessionLocal() as session:
+                await sync_progress_with_content(session)
+            logging.info("Progress reconciled with content")
+        except Exception as e:
+            logging.error(f"Ошибка фоновой сверки прогресса: {e}")
+
+
+def schedule_reconciliation():
+    # Запускает сверку прогресса в фоне после удаления контента админом.
+    # Повторные вызовы во время работы сливаются в один дополнительный проход.
+    global _reconcile_task, _reconcile_pending
+    _reconcile_pending = True
+    if _reconcile_task is None or _reconcile_task.done():
+        # Без контекста апдейта: его запросы не относятся к счётчику запросов апдейта
+        _reconcile_task = asyncio.create_task(_reconcile_loop(), context=contextvars.Context())
+
+
+
+async def warm_up():
+    # Вызывается при старте: заранее открывает соединения пула и загружает
+    # контент в кэш, чтобы первые апдейты не платили за холодный старт
+    async with AsyncExitStack() as stack:
+        connections = await asyncio.gather(*(
+            stack.enter_async_context(engine.connect()) for _ in range(engine_settings.pool_size)
+        ))
+        await asyncio.gather(*(conn.execute(text("SELECT 1")) for conn in connections))
+    async with AsyncSessionLocal() as session:
+        modules = await get_cached_modules(session)
+        lessons = 0
+        for module in modules:
+            for lesson in await get_cached_lessons(session, module.code):
+                await get_cached_questions(session, lesson.code)
+                lessons += 1
+    logging.info(f"Warm-up done: {engine_settings.pool_size} connections, {len(modules)} modules, {lessons} lessons cached")
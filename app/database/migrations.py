@@ -0,0 +1,105 @@
+import logging
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Изменения схемы для уже существующих баз (create_all в models.py пересоздаёт
+# таблицы с нуля). Номер шага — его позиция в списке, поэтому новые шаги
+# добавляются строго в конец. Применённые шаги записываются в schema_migrations.
+MIGRATIONS = [
+    "ALTER TABLE modules ADD COLUMN IF NOT EXISTS photo_file_id VARCHAR",
+    "ALTER TABLE lessons ADD COLUMN IF NOT EXISTS photo_file_id VARCHAR",
+    "ALTER TABLE test_questions ADD COLUMN IF NOT EXISTS photo_file_id VARCHAR",
+    # Результаты тестов привязываются к уроку внешним ключом с каскадным удалением
+    "ALTER TABLE user_test_scores ADD COLUMN IF NOT EXISTS lesson_code VARCHAR "
+    "REFERENCES lessons (code) ON DELETE CASCADE",
+    "UPDATE user_test_scores SET lesson_code = replace(test_code, '_test-', '_lesson-') "
+    "WHERE lesson_code IS NULL AND replace(test_code, '_test-', '_lesson-') IN (SELECT code FROM lessons)",
+    "DELETE FROM user_test_scores WHERE lesson_code IS NULL",
+    "CREATE TABLE IF NOT EXISTS fsm_records ("
+    "key VARCHAR PRIMARY KEY, state VARCHAR, data JSON, expires_at TIMESTAMP WITH TIME ZONE)",
+    "CREATE INDEX IF NOT EXISTS ix_fsm_records_expires_at ON fsm_records (expires_at)",
+    # Явный порядок уроков вместо разбора номера из кода
+    "ALTER TABLE lessons ADD COLUMN IF NOT EXISTS position INTEGER",
+    "UPDATE lessons SET position = substring(code from '_lesson-([0-9]+)$')::integer WHERE position IS NULL",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_lessons_module_position ON lessons (module_id, position)",
+    "ALTER TABLE modules ADD COLUMN IF NOT EXISTS last_lesson_position INTEGER NOT NULL DEFAULT 0",
+    "UPDATE modules SET last_lesson_position = "
+    "(SELECT COALESCE(MAX(position), 0) FROM lessons WHERE lessons.module_id = modules.id)",
+    # Индексы под выборки из requests.py и stats.py. Поиск по user_id покрывают
+    # уникальные ограничения (user_id, ...), по lessons.module_id — индекс
+    # (module_id, position). CONCURRENTLY не блокирует запись в большие таблицы.
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_progress_lesson_code ON user_progress (lesson_code)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_test_scores_lesson_code ON user_test_scores (lesson_code)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_test_scores_user_id_score "
+    "ON user_test_scores (user_id) INCLUDE (score, total)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_test_questions_lesson_code ON test_questions (lesson_code)",
+    # Явный порядок вопросов в тесте: нумеруем существующие в порядке id
+    "ALTER TABLE test_questions ADD COLUMN IF NOT EXISTS position INTEGER",
+    "UPDATE test_questions SET position = numbered.position FROM ("
+    "SELECT id, row_number() OVER (PARTITION BY lesson_code ORDER BY id) - 1 AS position FROM test_questions"
+    ") AS numbered WHERE test_questions.id = numbered.id AND test_questions.position IS NULL",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_test_questions_lesson_position ON test_questions (lesson_code, position)",
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_test_questions_lesson_code",
+    # Лучший и последний результат теста плюс история попыток
+    "ALTER TABLE user_test_scores ADD COLUMN IF NOT EXISTS best_score INTEGER",
+    "ALTER TABLE user_test_scores ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 1",
+    "ALTER TABLE user_test_scores ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE",
+    "UPDATE user_test_scores SET best_score = score WHERE best_score IS NULL",
+    "CREATE TABLE IF NOT EXISTS test_attempts ("
+    "id BIGSERIAL PRIMARY KEY, user_id BIGINT, test_code VARCHAR, score INTEGER, total INTEGER, "
+    "created_at TIMESTAMP WITH TIME ZONE)",
+    "CREATE INDEX IF NOT EXISTS ix_test_attempts_user_id ON test_attempts (user_id, created_at)",
+    # Журнал ответов на вопросы тестов
+    "CREATE TABLE IF NOT EXISTS answer_events ("
+    "id BIGSERIAL PRIMARY KEY, user_id BIGINT, question_id INTEGER, lesson_code VARCHAR, "
+    "chosen_option SMALLINT, is_correct BOOLEAN, latency_ms INTEGER, created_at TIMESTAMP WITH TIME ZONE)",
+    "CREATE INDEX IF NOT EXISTS ix_answer_events_question_id ON answer_events (question_id)",
+    "CREATE INDEX IF NOT EXISTS ix_answer_events_user_id ON answer_events (user_id, created_at)",
+    # Счётчики по вопросам; уже записанные ответы учитываются один раз здесь
+    "CREATE TABLE IF NOT EXISTS question_stats ("
+    "question_id INTEGER PRIMARY KEY REFERENCES test_questions (id) ON DELETE CASCADE, "
+    "attempts INTEGER NOT NULL DEFAULT 0, correct INTEGER NOT NULL DEFAULT 0, "
+    "option_1_picks INTEGER NOT NULL DEFAULT 0, option_2_picks INTEGER NOT NULL DEFAULT 0, "
+    "option_3_picks INTEGER NOT NULL DEFAULT 0)",
+    "INSERT INTO question_stats (question_id, attempts, correct, option_1_picks, option_2_picks, option_3_picks) "
+    "SELECT question_id, count(*), count(*) FILTER (WHERE is_correct), count(*) FILTER (WHERE chosen_option = 1), "
+    "count(*) FILTER (WHERE chosen_option = 2), count(*) FILTER (WHERE chosen_option = 3) "
+    "FROM answer_events WHERE question_id IN (SELECT id FROM test_questions) GROUP BY question_id "
+    "ON CONFLICT (question_id) DO NOTHING",
+    # Сводка по студентам; заполняется так же, как rebuild_user_summaries
+    "CREATE TABLE IF NOT EXISTS user_summary ("
+    "user_id BIGINT PRIMARY KEY REFERENCES users (id) ON DELETE CASCADE, "
+    "completed INTEGER NOT NULL DEFAULT 0, tests INTEGER NOT NULL DEFAULT 0, "
+    "attempts INTEGER NOT NULL DEFAULT 0, score_sum INTEGER NOT NULL DEFAULT 0, "
+    "avg_percent NUMERIC(5, 2) NOT NULL DEFAULT 0, last_activity_at TIMESTAMP WITH TIME ZONE)",
+    "CREATE INDEX IF NOT EXISTS ix_user_summary_completed ON user_summary (completed, user_id)",
+    "CREATE INDEX IF NOT EXISTS ix_user_summary_avg_percent ON user_summary (avg_percent, user_id)",
+    "INSERT INTO user_summary (user_id, completed, tests, attempts, score_sum, avg_percent, last_activity_at) "
+    "SELECT users.id, COALESCE(progress.completed, 0), COALESCE(scores.tests, 0), COALESCE(scores.attempts, 0), "
+    "COALESCE(scores.score_sum, 0), COALESCE(scores.avg_percent, 0), scores.last_activity_at FROM users "
+    "LEFT JOIN (SELECT user_id, count(*) AS completed FROM user_progress GROUP BY user_id) AS progress "
+    "ON progress.user_id = users.id "
+    "LEFT JOIN (SELECT user_id, count(*) AS tests, sum(attempts) AS attempts, sum(score) AS score_sum, "
+    "round(avg(score::numeric * 100 / NULLIF(total, 0)), 2) AS avg_percent, max(updated_at) AS last_activity_at "
+    "FROM user_test_scores GROUP BY user_id) AS scores ON scores.user_id = users.id "
+    "ON CONFLICT (user_id) DO NOTHING",
+    # Статистика читает user_summary, а пересчёт сводки берёт строки студента
+    # по unique_user_test (user_id, test_code): индекс только замедлял запись
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_user_test_scores_user_id_score",
+    # Версия вопроса: счётчики считают только ответы на текущие варианты
+    "ALTER TABLE test_questions ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE answer_events ADD COLUMN IF NOT EXISTS question_version INTEGER",
+    "ALTER TABLE question_stats ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0",
+]
+
+async def run_migrations(engine: AsyncEngine):
+    # AUTOCOMMIT: каждый шаг выполняется в своей транзакции (CREATE INDEX
+    # CONCURRENTLY внутри транзакции невозможен)
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY)"))
+        applied = (await conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_migrations"))).scalar()
+        for version, statement in enumerate(MIGRATIONS[applied:], start=applied + 1):
+            await conn.execute(text(statement))
+            await conn.execute(text("INSERT INTO schema_migrations (version) VALUES (:version)"), {"version": version})
+            logging.info(f"Applied schema migration {version}")
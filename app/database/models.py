@@ -1,98 +1,238 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker, declarative_base, relationship
-from sqlalchemy import Column, String, Integer, BigInteger, Boolean, ForeignKey, Text, SmallInteger, UniqueConstraint
-from config import DB_URL
-import asyncio
-
-engine = create_async_engine(DB_URL, echo=True)
-
-AsyncSessionLocal = sessionmaker(
-    engine, class_=AsyncSession, expire_on_commit=False
-)
-
-Base = declarative_base()
-
-class User(Base):
-    __tablename__ = 'users'
-    id = Column(BigInteger, primary_key=True)
-    first_name = Column(String)
-    last_name = Column(String)
-    username = Column(String)
-    is_admin = Column(Boolean, default=False)
-    progress = relationship("UserProgress", back_populates="user", cascade="all, delete")
-    test_scores = relationship("UserTestScore", back_populates="user", cascade="all, delete")
-
-class Module(Base):
-    __tablename__ = 'modules'
-    id = Column(Integer, primary_key=True)
-    code = Column(String, unique=True)
-    text = Column(Text)
-    photo = Column(String)
-    lessons = relationship("Lesson", back_populates="module", cascade="all, delete")
-
-class Lesson(Base):
-    __tablename__ = 'lessons'
-    id = Column(Integer, primary_key=True)
-    code = Column(String, unique=True)
-    module_id = Column(Integer, ForeignKey('modules.id', ondelete='CASCADE'))
-    text = Column(Text)
-    photo = Column(String)
-    video_link = Column(String)
-    notes_link = Column(String)
-    module = relationship("Module", back_populates="lessons")
-    questions = relationship("TestQuestion", back_populates="lesson", cascade="all, delete")
-    completed_by = relationship("UserProgress", back_populates="lesson", cascade="all, delete")
-    test_scores = relationship(
-        "UserTestScore",
-        primaryjoin="foreign(UserTestScore.test_code) == Lesson.code",
-        viewonly=True
-    )
-
-class TestQuestion(Base):
-    __tablename__ = 'test_questions'
-    id = Column(Integer, primary_key=True)
-    lesson_code = Column(String, ForeignKey('lessons.code', ondelete='CASCADE'))
-    question_text = Column(Text)
-    option_1 = Column(String)
-    option_2 = Column(String)
-    option_3 = Column(String)
-    correct_option = Column(SmallInteger)
-    photo = Column(String)
-    lesson = relationship("Lesson", back_populates="questions")
-
-class UserProgress(Base):
-    __tablename__ = 'user_progress'
-    id = Column(Integer, primary_key=True)
-    user_id = Column(BigInteger, ForeignKey('users.id', ondelete='CASCADE'))
-    lesson_code = Column(String, ForeignKey('lessons.code', ondelete='CASCADE'))
-    completed = Column(Boolean, default=True)
-    user = relationship("User", back_populates="progress")
-    lesson = relationship("Lesson", back_populates="completed_by")
-    __table_args__ = (
-        UniqueConstraint('user_id', 'lesson_code', name='unique_user_lesson'),
-    )
-
-class UserTestScore(Base):
-    __tablename__ = 'user_test_scores'
-    id = Column(Integer, primary_key=True)
-    user_id = Column(BigInteger, ForeignKey('users.id', ondelete='CASCADE'))
-    test_code = Column(String)
-    score = Column(Integer)
-    total = Column(Integer)
-    user = relationship("User", back_populates="test_scores")
-    lesson = relationship(
-        "Lesson",
-        primaryjoin="foreign(UserTestScore.test_code) == Lesson.code",
-        viewonly=True
-    )
-    __table_args__ = (
-        UniqueConstraint('user_id', 'test_code', name='unique_user_test'),
-    )
-
-async def create_all():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.drop_all)
-        await conn.run_sync(Base.metadata.create_all)
-
-if __name__ == "__main__":
+from dataclasses import dataclass
+from uuid import uuid4
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
+from sqlalchemy.orm import sessionmaker, declarative_base, relationship, query_expression
+from sqlalchemy import Column, String, Integer, BigInteger, Boolean, ForeignKey, Text, SmallInteger, UniqueConstraint, Index, JSON, DateTime, Numeric
+from config import DB_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING, DB_STATEMENT_CACHE_SIZE, DB_PGBOUNCER
+import asyncio
+
+@dataclass(frozen=True)
+class EngineSettings:
+    url: str = DB_URL
+    pool_size: int = DB_POOL_SIZE
+    max_overflow: int = DB_MAX_OVERFLOW
+    pool_timeout: float = DB_POOL_TIMEOUT
+    pool_recycle: int = DB_POOL_RECYCLE
+    pool_pre_ping: bool = DB_POOL_PRE_PING
+    statement_cache_size: int = DB_STATEMENT_CACHE_SIZE
+    pgbouncer: bool = DB_PGBOUNCER
+
+def _connect_args(settings: EngineSettings) -> dict:
+    if not settings.pgbouncer:
+        return {"prepared_statement_cache_size": settings.statement_cache_size}
+    # asyncpg называет выражения __asyncpg_stmt_N__ по счётчику соединения,
+    # за pgbouncer эти имена сталкиваются между клиентами
+    return {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+    }
+
+def build_engine(settings: EngineSettings) -> AsyncEngine:
+    # SQL логируется через app.database.instrumentation (DB_LOG_LEVEL), не через echo
+    return create_async_engine(
+        settings.url,
+        pool_size=settings.pool_size,
+        max_overflow=settings.max_overflow,
+        pool_timeout=settings.pool_timeout,
+        pool_recycle=settings.pool_recycle,
+        pool_pre_ping=settings.pool_pre_ping,
+        connect_args=_connect_args(settings)
+    )
+
+engine_settings = EngineSettings()
+engine = build_engine(engine_settings)
+
+AsyncSessionLocal = sessionmaker(
+    engine, class_=AsyncSession, expire_on_commit=False
+)
+
+Base = declarative_base()
+
+class User(Base):
+    __tablename__ = 'users'
+    id = Column(BigInteger, primary_key=True)
+    first_name = Column(String)
+    last_name = Column(String)
+    username = Column(String)
+    is_admin = Column(Boolean, default=False)
+    progress = relationship("UserProgress", back_populates="user", cascade="all, delete")
+    test_scores = relationship("UserTestScore", back_populates="user", cascade="all, delete")
+    # Заполняются только при загрузке с профилем UserLoad.COUNTS
+    completed_count = query_expression()
+    test_count = query_expression()
+
+class Module(Base):
+    __tablename__ = 'modules'
+    id = Column(Integer, primary_key=True)
+    code = Column(String, unique=True)
+    text = Column(Text)
+    photo = Column(String)
+    photo_file_id = Column(String)
+    # Последний выданный номер урока; номера удалённых уроков не переиспользуются
+    last_lesson_position = Column(Integer, nullable=False, default=0, server_default="0")
+    lessons = relationship("Lesson", back_populates="module", cascade="all, delete")
+
+class Lesson(Base):
+    __tablename__ = 'lessons'
+    id = Column(Integer, primary_key=True)
+    code = Column(String, unique=True)
+    module_id = Column(Integer, ForeignKey('modules.id', ondelete='CASCADE'))
+    # Порядковый номер урока в модуле, тот же, что в коде <module>_lesson-<position>
+    position = Column(Integer)
+    text = Column(Text)
+    photo = Column(String)
+    photo_file_id = Column(String)
+    video_link = Column(String)
+    notes_link = Column(String)
+    module = relationship("Module", back_populates="lessons")
+    questions = relationship("TestQuestion", back_populates="lesson", cascade="all, delete")
+    completed_by = relationship("UserProgress", back_populates="lesson", cascade="all, delete")
+    test_scores = relationship(
+        "UserTestScore",
+        primaryjoin="foreign(UserTestScore.test_code) == Lesson.code",
+        viewonly=True
+    )
+    __table_args__ = (
+        Index('ix_lessons_module_position', 'module_id', 'position', unique=True),
+    )
+
+class TestQuestion(Base):
+    __tablename__ = 'test_questions'
+    id = Column(Integer, primary_key=True)
+    lesson_code = Column(String, ForeignKey('lessons.code', ondelete='CASCADE'))
+    # Номер вопроса в тесте с нуля, совпадает с question_idx в хендлерах
+    position = Column(Integer)
+    question_text = Column(Text)
+    option_1 = Column(String)
+    option_2 = Column(String)
+    option_3 = Column(String)
+    correct_option = Column(SmallInteger)
+    # Растёт при смене вариантов или верного ответа: ответы на прежнюю версию
+    # не попадают в счётчики question_stats новой
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    photo = Column(String)
+    photo_file_id = Column(String)
+    lesson = relationship("Lesson", back_populates="questions")
+    __table_args__ = (
+        Index('ix_test_questions_lesson_position', 'lesson_code', 'position'),
+    )
+
+class UserProgress(Base):
+    __tablename__ = 'user_progress'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, ForeignKey('users.id', ondelete='CASCADE'))
+    lesson_code = Column(String, ForeignKey('lessons.code', ondelete='CASCADE'))
+    completed = Column(Boolean, default=True)
+    user = relationship("User", back_populates="progress")
+    lesson = relationship("Lesson", back_populates="completed_by")
+    __table_args__ = (
+        # Ведёт по user_id: покрывает выборку прогресса студента и подсчёт по студентам
+        UniqueConstraint('user_id', 'lesson_code', name='unique_user_lesson'),
+        # Каскад при удалении урока и фоновая сверка ищут по lesson_code
+        Index('ix_user_progress_lesson_code', 'lesson_code'),
+    )
+
+class UserTestScore(Base):
+    __tablename__ = 'user_test_scores'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, ForeignKey('users.id', ondelete='CASCADE'))
+    test_code = Column(String)
+    # Урок теста: удаление урока каскадно удаляет результаты
+    lesson_code = Column(String, ForeignKey('lessons.code', ondelete='CASCADE'))
+    # Последняя попытка
+    score = Column(Integer)
+    total = Column(Integer)
+    best_score = Column(Integer)
+    attempts = Column(Integer, nullable=False, default=1, server_default="1")
+    updated_at = Column(DateTime(timezone=True))
+    user = relationship("User", back_populates="test_scores")
+    lesson = relationship(
+        "Lesson",
+        primaryjoin="foreign(UserTestScore.test_code) == Lesson.code",
+        viewonly=True
+    )
+    __table_args__ = (
+        UniqueConstraint('user_id', 'test_code', name='unique_user_test'),
+        Index('ix_user_test_scores_lesson_code', 'lesson_code'),
+    )
+
+class UserSummary(Base):
+    # Сводка по студенту для статистики и /account. Обновляется в той же
+    # транзакции, что и прогресс или результат теста; полностью пересчитывается
+    # rebuild_user_summaries
+    __tablename__ = 'user_summary'
+    user_id = Column(BigInteger, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    completed = Column(Integer, nullable=False, default=0)
+    # Число пройденных тестов, сумма попыток и последних баллов по ним
+    tests = Column(Integer, nullable=False, default=0)
+    attempts = Column(Integer, nullable=False, default=0)
+    score_sum = Column(Integer, nullable=False, default=0)
+    # Средний % последних попыток, как в user_test_averages; 0 без тестов
+    avg_percent = Column(Numeric(5, 2), nullable=False, default=0)
+    last_activity_at = Column(DateTime(timezone=True))
+    __table_args__ = (
+        # Фильтры и сортировки списка студентов с keyset-пагинацией
+        Index('ix_user_summary_completed', 'completed', 'user_id'),
+        Index('ix_user_summary_avg_percent', 'avg_percent', 'user_id'),
+    )
+
+class TestAttempt(Base):
+    # История всех попыток прохождения тестов, только дозапись пачками
+    __tablename__ = 'test_attempts'
+    id = Column(BigInteger, primary_key=True)
+    user_id = Column(BigInteger)
+    test_code = Column(String)
+    score = Column(Integer)
+    total = Column(Integer)
+    created_at = Column(DateTime(timezone=True))
+    __table_args__ = (
+        Index('ix_test_attempts_user_id', 'user_id', 'created_at'),
+    )
+
+class AnswerEvent(Base):
+    # Каждый ответ на вопрос теста, только дозапись пачками
+    __tablename__ = 'answer_events'
+    id = Column(BigInteger, primary_key=True)
+    user_id = Column(BigInteger)
+    question_id = Column(Integer)
+    lesson_code = Column(String)
+    chosen_option = Column(SmallInteger)
+    is_correct = Column(Boolean)
+    # Версия вопроса, на которую ответили (TestQuestion.version)
+    question_version = Column(Integer)
+    # Время от показа вопроса до ответа; None, если момент показа неизвестен
+    latency_ms = Column(Integer)
+    created_at = Column(DateTime(timezone=True))
+    __table_args__ = (
+        Index('ix_answer_events_question_id', 'question_id'),
+        Index('ix_answer_events_user_id', 'user_id', 'created_at'),
+    )
+
+class QuestionStats(Base):
+    # Сводные счётчики ответов на вопрос, пополняются при каждой записи
+    # пачки answer_events — статистика не требует сканировать журнал
+    __tablename__ = 'question_stats'
+    question_id = Column(Integer, ForeignKey('test_questions.id', ondelete='CASCADE'), primary_key=True)
+    # Версия вопроса, к которой относятся счётчики
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    attempts = Column(Integer, nullable=False, default=0)
+    correct = Column(Integer, nullable=False, default=0)
+    option_1_picks = Column(Integer, nullable=False, default=0)
+    option_2_picks = Column(Integer, nullable=False, default=0)
+    option_3_picks = Column(Integer, nullable=False, default=0)
+
+class FsmRecord(Base):
+    __tablename__ = 'fsm_records'
+    key = Column(String, primary_key=True)
+    state = Column(String)
+    data = Column(JSON)
+    expires_at = Column(DateTime(timezone=True), index=True)
+
+async def create_all():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+if __name__ == "__main__":
     asyncio.run(create_all())
\ No newline at end of file
@@ -1,159 +1,502 @@
-import logging
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
-from app.database.models import User, Module, Lesson, TestQuestion, UserProgress, UserTestScore
-from typing import Dict, List, Optional
-
-async def get_all_modules(session: AsyncSession) -> List[Module]:
-    result = await session.execute(select(Module))
-    return result.scalars().all()
-
-async def get_module_by_code(session: AsyncSession, code: str) -> Optional[Module]:
-    result = await session.execute(select(Module).where(Module.code == code))
-    return result.scalars().first()
-
-async def create_module(session: AsyncSession, code: str, text: str, photo: str) -> Module:
-    module = Module(code=code, text=text, photo=photo)
-    session.add(module)
-    await session.commit()
-    return module
-
-async def delete_module(session: AsyncSession, code: str):
-    await session.execute(delete(Module).where(Module.code == code))
-    await session.commit()
-
-async def get_lessons_by_module(session: AsyncSession, module_code: str) -> List[Lesson]:
-    result = await session.execute(
-        select(Lesson).join(Module).where(Module.code == module_code)
-    )
-    return result.scalars().all()
-
-async def get_lesson_by_code(session: AsyncSession, code: str) -> Optional[Lesson]:
-    result = await session.execute(select(Lesson).where(Lesson.code == code))
-    return result.scalars().first()
-
-async def create_lesson(session: AsyncSession, code: str, module_id: int, text: str, photo: str, video_link: str, notes_link: str) -> Lesson:
-    lesson = Lesson(
-        code=code, module_id=module_id, text=text, photo=photo,
-        video_link=video_link, notes_link=notes_link
-    )
-    session.add(lesson)
-    await session.commit()
-    return lesson
-
-async def update_lesson(session: AsyncSession, lesson: Lesson, field: str, value: str):
-    if field == "text":
-        lesson.text = value
-    elif field == "photo":
-        lesson.photo = value
-    elif field == "video":
-        lesson.video_link = value
-    elif field == "notes":
-        lesson.notes_link = value
-    await session.commit()
-
-async def delete_lesson(session: AsyncSession, code: str):
-    await session.execute(delete(Lesson).where(Lesson.code == code))
-    await session.commit()
-
-async def get_test_questions_by_lesson(session: AsyncSession, lesson_code: str) -> List[TestQuestion]:
-    result = await session.execute(
-        select(TestQuestion).where(TestQuestion.lesson_code == lesson_code)
-    )
-    return result.scalars().all()
-
-async def create_test_question(session: AsyncSession, lesson_code: str, question_text: str, options: List[str], correct_option: int, photo: str) -> TestQuestion:
-    question = TestQuestion(
-        lesson_code=lesson_code, question_text=question_text,
-        option_1=options[0], option_2=options[1],
-        option_3=options[2] if len(options) > 2 else None,
-        correct_option=correct_option, photo=photo
-    )
-    session.add(question)
-    await session.commit()
-    return question
-
-async def update_test_question(session: AsyncSession, question: TestQuestion, field: str, value):
-    if field == "question":
-        question.question_text = value
-    elif field == "options":
-        options = [opt.strip() for opt in value.split("\n")]
-        question.option_1 = options[0]
-        question.option_2 = options[1]
-        question.option_3 = options[2] if len(options) > 2 else None
-    elif field == "correct":
-        question.correct_option = int(value)
-    elif field == "photo":
-        question.photo = value
-    await session.commit()
-
-async def delete_test_question(session: AsyncSession, question_id: int):
-    await session.execute(delete(TestQuestion).where(TestQuestion.id == question_id))
-    await session.commit()
-
-async def get_user_by_id(session: AsyncSession, user_id: int) -> Optional[User]:
-    result = await session.execute(select(User).where(User.id == user_id))
-    return result.scalars().first()
-
-async def create_user(session: AsyncSession, user_id: int, first_name: str, last_name: str, username: str, is_admin: bool = False) -> User:
-    user = User(
-        id=user_id, first_name=first_name, last_name=last_name,
-        username=username, is_admin=is_admin
-    )
-    session.add(user)
-    await session.commit()
-    return user
-
-async def get_all_users(session: AsyncSession) -> List[User]:
-    result = await session.execute(select(User))
-    return result.scalars().all()
-
-async def get_user_progress(session: AsyncSession, user_id: int) -> List[UserProgress]:
-    result = await session.execute(
-        select(UserProgress).where(UserProgress.user_id == user_id)
-    )
-    return result.scalars().all()
-
-async def mark_lesson_completed(session: AsyncSession, user_id: int, lesson_code: str):
-    progress = UserProgress(user_id=user_id, lesson_code=lesson_code, completed=True)
-    session.add(progress)
-    await session.commit()
-
-async def get_user_test_scores(session: AsyncSession, user_id: int) -> List[UserTestScore]:
-    result = await session.execute(
-        select(UserTestScore).where(UserTestScore.user_id == user_id)
-    )
-    return result.scalars().all()
-
-async def save_test_score(session: AsyncSession, user_id: int, test_code: str, score: int, total: int):
-    test_score = UserTestScore(user_id=user_id, test_code=test_code, score=score, total=total)
-    session.add(test_score)
-    await session.commit()
-
-async def sync_progress_with_content(session: AsyncSession):
-    # Удаляем прогресс и результаты тестов для уроков, которых больше нет
-    lessons = (await session.execute(select(Lesson))).scalars().all()
-    lesson_codes = {lesson.code for lesson in lessons}
-    test_codes = {lesson.code.replace("lesson", "test") for lesson in lessons}
-
-    # Удаляем прогресс для несуществующих уроков
-    await session.execute(
-        delete(UserProgress).where(UserProgress.lesson_code.not_in(lesson_codes))
-    )
-    # Удаляем результаты тестов для несуществующих тестов
-    await session.execute(
-        delete(UserTestScore).where(UserTestScore.test_code.not_in(test_codes))
-    )
-    await session.commit()
-
-
-async def update_user(db_session, user, first_name: str, last_name: str):
-    try:
-        user.first_name = first_name
-        user.last_name = last_name
-        await db_session.commit()
-        logging.info(f"Updated user {user.id}: first_name={first_name}, last_name={last_name}")
-    except Exception as e:
-        await db_session.rollback()
-        logging.error(f"Error updating user {user.id}: {e}")
-        raise
\ No newline at end of file
+import logging
+from datetime import datetime, timezone
+from decimal import Decimal
+from enum import Enum
+from functools import partial
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy import select, insert, delete, update, func, case, cast, literal, values, column, tuple_, String, Integer, BigInteger, Numeric, DateTime
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import raiseload, selectinload, with_expression
+from app.database.models import User, Module, Lesson, TestQuestion, UserProgress, UserTestScore, TestAttempt, AnswerEvent, QuestionStats, UserSummary, AsyncSessionLocal
+from app.database.cache import content_cache, user_cache, ModuleSnapshot, LessonSnapshot, QuestionSnapshot
+from app.database.batch import BatchWriter
+from app.database.leaderboard import leaderboard
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+QUESTION_COUNTERS = ("attempts", "correct", "option_1_picks", "option_2_picks", "option_3_picks")
+
+async def update_question_stats(session: AsyncSession, events: List[Dict]):
+    # Вызывается пакетной записью answer_events в той же транзакции: счётчики
+    # пачки суммируются здесь и прибавляются к question_stats одним upsert'ом.
+    # Ответы на уже удалённые вопросы отбрасываются.
+    # Счётчики ведутся по версии вопроса: ответы на прежнюю версию (из очереди
+    # или из снимка теста, взятого до правки) не смешиваются с новой, а первая
+    # пачка новой версии заменяет счётчики старой.
+    versions: Dict[int, int] = {}
+    for event in events:
+        question_id = event["question_id"]
+        versions[question_id] = max(versions.get(question_id, 0), event["question_version"])
+    totals: Dict[int, Dict[str, int]] = {}
+    for event in events:
+        if event["question_version"] != versions[event["question_id"]]:
+            continue
+        counters = totals.setdefault(event["question_id"], dict.fromkeys(QUESTION_COUNTERS, 0))
+        counters["attempts"] += 1
+        counters["correct"] += 1 if event["is_correct"] else 0
+        pick = f"option_{event['chosen_option']}_picks"
+        if pick in counters:
+            counters[pick] += 1
+    batch = values(
+        column("question_id", Integer), column("version", Integer),
+        *(column(name, Integer) for name in QUESTION_COUNTERS), name="batch"
+    ).data([
+        (question_id, versions[question_id], *counters.values()) for question_id, counters in totals.items()
+    ])
+    statement = pg_insert(QuestionStats).from_select(
+        ["question_id", "version", *QUESTION_COUNTERS],
+        select(batch).where(batch.c.question_id.in_(select(TestQuestion.id)))
+    )
+    same_version = QuestionStats.version == statement.excluded.version
+    statement = statement.on_conflict_do_update(
+        index_elements=[QuestionStats.question_id],
+        set_={
+            "version": statement.excluded.version,
+            **{
+                name: case((same_version, getattr(QuestionStats, name) + statement.excluded[name]), else_=statement.excluded[name])
+                for name in QUESTION_COUNTERS
+            },
+        },
+        # Запоздавшая пачка прежней версии не трогает счётчики новой
+        where=QuestionStats.version <= statement.excluded.version
+    )
+    await session.execute(statement)
+
+test_attempts_writer = BatchWriter(TestAttempt)
+answer_events_writer = BatchWriter(AnswerEvent, on_flush=update_question_stats)
+
+async def _commit(session: AsyncSession, *invalidations: Callable[[], None], on_commit: Sequence[Callable[[], None]] = ()):
+    # В режиме единицы работы (session.info["unit_of_work"]) изменения только
+    # отправляются в БД, а фиксирует их DbSessionMiddleware один раз за апдейт.
+    # Кэши сбрасываются сразу и ещё раз после завершения транзакции: чтения,
+    # успевшие закэшировать незафиксированные данные, не переживут её.
+    # on_commit вызываются только после успешной фиксации.
+    if session.info.get("unit_of_work"):
+        await session.flush()
+        session.info.setdefault("after_commit", []).extend(invalidations)
+        session.info.setdefault("on_commit", []).extend(on_commit)
+    else:
+        await session.commit()
+        for callback in on_commit:
+            callback()
+    for invalidate in invalidations:
+        invalidate()
+
+async def get_all_modules(session: AsyncSession) -> List[Module]:
+    result = await session.execute(select(Module))
+    return result.scalars().all()
+
+async def get_module_by_code(session: AsyncSession, code: str) -> Optional[Module]:
+    result = await session.execute(select(Module).where(Module.code == code))
+    return result.scalars().first()
+
+async def create_module(session: AsyncSession, code: str, text: str, photo: str) -> Module:
+    module = Module(code=code, text=text, photo=photo)
+    session.add(module)
+    await _commit(session, content_cache.invalidate_modules)
+    return module
+
+async def delete_module(session: AsyncSession, code: str, on_commit: Sequence[Callable[[], None]] = ()):
+    # on_commit — например, schedule_reconciliation: сверка должна видеть
+    # уже зафиксированное удаление
+    await session.execute(delete(Module).where(Module.code == code))
+    await _commit(session, content_cache.clear, on_commit=on_commit)
+
+async def get_lessons_by_module(session: AsyncSession, module_code: str) -> List[Lesson]:
+    result = await session.execute(
+        select(Lesson).join(Module).where(Module.code == module_code).order_by(Lesson.position, Lesson.id)
+    )
+    return result.scalars().all()
+
+async def get_lesson_by_code(session: AsyncSession, code: str) -> Optional[Lesson]:
+    result = await session.execute(select(Lesson).where(Lesson.code == code))
+    return result.scalars().first()
+
+async def get_next_lesson_position(session: AsyncSession, module_id: int) -> int:
+    result = await session.execute(select(Module.last_lesson_position + 1).where(Module.id == module_id))
+    return result.scalar()
+
+async def create_lesson(session: AsyncSession, module_id: int, text: str, photo: str, video_link: str, notes_link: str) -> Lesson:
+    # Номер и код урока выделяются тем же запросом, что вставляет урок: UPDATE
+    # счётчика модуля в CTE блокирует строку модуля, поэтому параллельные
+    # добавления получают разные номера, а не ошибку уникальности
+    allocated = (
+        update(Module)
+        .where(Module.id == module_id)
+        .values(last_lesson_position=Module.last_lesson_position + 1)
+        .returning(Module.id, Module.code, Module.last_lesson_position)
+        .cte("allocated")
+    )
+    statement = (
+        insert(Lesson)
+        .from_select(
+            ["module_id", "code", "position", "text", "photo", "video_link", "notes_link"],
+            select(
+                allocated.c.id,
+                allocated.c.code + "_lesson-" + cast(allocated.c.last_lesson_position, String),
+                allocated.c.last_lesson_position,
+                literal(text), literal(photo), literal(video_link), literal(notes_link)
+            )
+        )
+        .returning(Lesson.id)
+    )
+    lesson_id = (await session.execute(statement)).scalar_one()
+    lesson = await session.get(Lesson, lesson_id)
+    await _commit(session, partial(content_cache.invalidate_lesson, lesson.code))
+    return lesson
+
+async def update_lesson(session: AsyncSession, lesson: Lesson, field: str, value: str):
+    if field == "text":
+        lesson.text = value
+    elif field == "photo":
+        lesson.photo = value
+        lesson.photo_file_id = None
+    elif field == "video":
+        lesson.video_link = value
+    elif field == "notes":
+        lesson.notes_link = value
+    await _commit(session, partial(content_cache.invalidate_lesson, lesson.code))
+
+async def delete_lesson(session: AsyncSession, code: str, on_commit: Sequence[Callable[[], None]] = ()):
+    await session.execute(delete(Lesson).where(Lesson.code == code))
+    await _commit(
+        session,
+        partial(content_cache.invalidate_lesson, code),
+        partial(content_cache.invalidate_questions, code),
+        on_commit=on_commit
+    )
+
+async def get_test_questions_by_lesson(session: AsyncSession, lesson_code: str) -> List[TestQuestion]:
+    result = await session.execute(
+        select(TestQuestion).where(TestQuestion.lesson_code == lesson_code).order_by(TestQuestion.position, TestQuestion.id)
+    )
+    return result.scalars().all()
+
+async def get_test_question_by_position(session: AsyncSession, lesson_code: str, position: int) -> Optional[TestQuestion]:
+    # position совпадает с индексом вопроса в тесте (question_idx), с нуля
+    result = await session.execute(
+        select(TestQuestion)
+        .where(TestQuestion.lesson_code == lesson_code, TestQuestion.position == position)
+        .order_by(TestQuestion.id)
+        .limit(1)
+    )
+    return result.scalars().first()
+
+async def _lock_lesson(session: AsyncSession, lesson_code) -> Optional[str]:
+    # Номера вопросов урока меняются только под блокировкой строки урока, и
+    # берётся она до блокировок строк вопросов — иначе взаимоблокировка.
+    # NO KEY UPDATE не мешает вставкам, ссылающимся на урок внешним ключом.
+    result = await session.execute(
+        select(Lesson.code).where(Lesson.code == lesson_code).with_for_update(key_share=True)
+    )
+    return result.scalar()
+
+async def create_test_question(session: AsyncSession, lesson_code: str, question_text: str, options: List[str], correct_option: int, photo: str) -> TestQuestion:
+    # Новый вопрос встаёт в конец теста. Номер считается в самом INSERT после
+    # блокировки урока: параллельное добавление ждёт коммита и, начиная новый
+    # запрос, видит уже вставленный вопрос.
+    await _lock_lesson(session, lesson_code)
+    statement = (
+        insert(TestQuestion)
+        .from_select(
+            ["lesson_code", "question_text", "option_1", "option_2", "option_3", "correct_option", "photo", "position"],
+            select(
+                literal(lesson_code), literal(question_text),
+                literal(options[0]), literal(options[1]),
+                literal(options[2] if len(options) > 2 else None, String),
+                literal(correct_option, Integer), literal(photo),
+                func.coalesce(func.max(TestQuestion.position) + 1, 0)
+            ).where(TestQuestion.lesson_code == lesson_code)
+        )
+        .returning(TestQuestion.id)
+    )
+    question_id = (await session.execute(statement)).scalar_one()
+    question = await session.get(TestQuestion, question_id)
+    await _commit(session, partial(content_cache.invalidate_questions, lesson_code))
+    return question
+
+async def update_test_question(session: AsyncSession, question: TestQuestion, field: str, value):
+    if field == "question":
+        question.question_text = value
+    elif field == "options":
+        options = [opt.strip() for opt in value.split("\n")]
+        question.option_1 = options[0]
+        question.option_2 = options[1]
+        question.option_3 = options[2] if len(options) > 2 else None
+    elif field == "correct":
+        question.correct_option = int(value)
+    elif field == "photo":
+        question.photo = value
+        question.photo_file_id = None
+    if field in ("options", "correct"):
+        # Старые счётчики относятся к другим вариантам ответа — начинаем заново.
+        # Ответы, данные на прежнюю версию, отсеет update_question_stats
+        question.version = question.version + 1
+        await session.execute(delete(QuestionStats).where(QuestionStats.question_id == question.id))
+    await _commit(session, partial(content_cache.invalidate_questions, question.lesson_code))
+
+async def delete_test_question(session: AsyncSession, question_id: int):
+    lesson_code = await _lock_lesson(
+        session, select(TestQuestion.lesson_code).where(TestQuestion.id == question_id).scalar_subquery()
+    )
+    if lesson_code is None:
+        return
+    result = await session.execute(delete(TestQuestion).where(TestQuestion.id == question_id))
+    if not result.rowcount:
+        return
+    # Сдвигаем номера оставшихся вопросов, чтобы они снова шли 0..n-1
+    numbered = (
+        select(TestQuestion.id, (func.row_number().over(order_by=(TestQuestion.position, TestQuestion.id)) - 1).label("position"))
+        .where(TestQuestion.lesson_code == lesson_code)
+        .subquery()
+    )
+    await session.execute(
+        update(TestQuestion)
+        .where(TestQuestion.id == numbered.c.id, TestQuestion.position.is_distinct_from(numbered.c.position))
+        .values(position=numbered.c.position)
+    )
+    await _commit(session, partial(content_cache.invalidate_questions, lesson_code))
+
+async def save_photo_file_id(item: Union[ModuleSnapshot, LessonSnapshot, QuestionSnapshot], file_id: str, session_pool: async_sessionmaker[AsyncSession] = AsyncSessionLocal):
+    # Своя короткая транзакция, а не сессия апдейта: блокировка строки не
+    # держится, пока хендлер ждёт Telegram. Сравнение с фото и file_id снимка:
+    # не затираем замену фото админом и file_id, сохранённый параллельно.
+    if isinstance(item, ModuleSnapshot):
+        model = Module
+    elif isinstance(item, LessonSnapshot):
+        model = Lesson
+    else:
+        model = TestQuestion
+    async with session_pool() as session:
+        result = await session.execute(
+            update(model)
+            .where(
+                model.id == item.id,
+                model.photo == item.photo,
+                model.photo_file_id.is_not_distinct_from(item.photo_file_id)
+            )
+            .values(photo_file_id=file_id)
+        )
+        await session.commit()
+    if result.rowcount:
+        content_cache.set_photo_file_id(item, file_id)
+
+async def get_user_by_id(session: AsyncSession, user_id: int) -> Optional[User]:
+    result = await session.execute(select(User).where(User.id == user_id))
+    return result.scalars().first()
+
+async def create_user(session: AsyncSession, user_id: int, first_name: str, last_name: str, username: str, is_admin: bool = False) -> User:
+    user = User(
+        id=user_id, first_name=first_name, last_name=last_name,
+        username=username, is_admin=is_admin
+    )
+    session.add(user)
+    session.add(UserSummary(user_id=user_id))
+    await _commit(session, partial(user_cache.invalidate, user_id), on_commit=[partial(leaderboard.update, user_id, 0, 0)])
+    return user
+
+class UserLoad(Enum):
+    # Связи не загружаются, обращение к ним сразу падает вместо ленивой загрузки
+    NONE = "none"
+    # progress и test_scores подгружаются двумя запросами selectin на весь список
+    RELATIONS = "relations"
+    # Только агрегаты completed_count и test_count, посчитанные в том же запросе
+    COUNTS = "counts"
+
+def _user_load_options(load: UserLoad):
+    if load is UserLoad.RELATIONS:
+        return [selectinload(User.progress), selectinload(User.test_scores), raiseload("*")]
+    if load is UserLoad.COUNTS:
+        completed_count = (
+            select(func.count(UserProgress.id)).where(UserProgress.user_id == User.id).scalar_subquery()
+        )
+        test_count = (
+            select(func.count(UserTestScore.id)).where(UserTestScore.user_id == User.id).scalar_subquery()
+        )
+        return [
+            with_expression(User.completed_count, completed_count),
+            with_expression(User.test_count, test_count),
+            raiseload("*"),
+        ]
+    return [raiseload("*")]
+
+async def get_all_users(session: AsyncSession, load: UserLoad = UserLoad.NONE) -> List[User]:
+    result = await session.execute(select(User).options(*_user_load_options(load)))
+    return result.scalars().all()
+
+async def get_user_progress(session: AsyncSession, user_id: int) -> List[UserProgress]:
+    result = await session.execute(
+        select(UserProgress).where(UserProgress.user_id == user_id)
+    )
+    return result.scalars().all()
+
+async def mark_lesson_completed(session: AsyncSession, user_id: int, lesson_code: str):
+    # Повторное прохождение урока ничего не меняет и не падает на unique_user_lesson
+    await session.execute(
+        pg_insert(UserProgress)
+        .values(user_id=user_id, lesson_code=lesson_code, completed=True)
+        .on_conflict_do_nothing(constraint='unique_user_lesson')
+    )
+    summary = await _refresh_summary_progress(session, user_id)
+    await _commit(session, on_commit=[partial(leaderboard.update, user_id, *summary)])
+
+async def get_user_test_scores(session: AsyncSession, user_id: int) -> List[UserTestScore]:
+    result = await session.execute(
+        select(UserTestScore).where(UserTestScore.user_id == user_id)
+    )
+    return result.scalars().all()
+
+async def save_test_score(session: AsyncSession, user_id: int, test_code: str, score: int, total: int):
+    # Один upsert на попытку: score/total — последняя попытка, best_score — лучшая.
+    # Сама попытка уходит в историю test_attempts пачкой после фиксации.
+    now = datetime.now(timezone.utc)
+    statement = pg_insert(UserTestScore).values(
+        user_id=user_id, test_code=test_code, lesson_code=test_code.replace("_test-", "_lesson-"),
+        score=score, total=total, best_score=score, attempts=1, updated_at=now
+    )
+    statement = statement.on_conflict_do_update(
+        constraint='unique_user_test',
+        set_={
+            "score": statement.excluded.score,
+            "total": statement.excluded.total,
+            "best_score": func.greatest(UserTestScore.best_score, statement.excluded.score),
+            "attempts": UserTestScore.attempts + 1,
+            "updated_at": statement.excluded.updated_at,
+        }
+    )
+    await session.execute(statement)
+    summary = await _refresh_summary_scores(session, user_id)
+    attempt = {"user_id": user_id, "test_code": test_code, "score": score, "total": total, "created_at": now}
+    await _commit(session, on_commit=[
+        partial(test_attempts_writer.add, attempt),
+        partial(leaderboard.update, user_id, *summary),
+    ])
+
+def user_score_aggregates():
+    # Поля user_summary, которые считаются по результатам тестов студента
+    return (
+        func.count(UserTestScore.id).label("tests"),
+        func.coalesce(func.sum(UserTestScore.attempts), 0).label("attempts"),
+        func.coalesce(func.sum(UserTestScore.score), 0).label("score_sum"),
+        func.coalesce(
+            func.round(func.avg(cast(UserTestScore.score, Numeric) * 100 / func.nullif(UserTestScore.total, 0)), 2), 0
+        ).label("avg_percent"),
+    )
+
+SUMMARY_COLUMNS = ("completed", "tests", "attempts", "score_sum", "avg_percent")
+
+async def _refresh_user_summary(session: AsyncSession, user_id: int, columns, *where) -> Tuple[int, Decimal]:
+    # Пересчитывает часть сводки одного студента по его же строкам (index scan
+    # по user_id) вместо прибавления дельт.
+    # Сначала строка сводки блокируется (и создаётся, если её нет): параллельный
+    # пересчёт того же студента ждёт фиксации и следующим запросом агрегирует
+    # уже вместе с её строками. Без блокировки каждый считал бы по своему
+    # снимку, и последний записал бы устаревшие суммы.
+    # Возвращает (completed, avg_percent) для обновления рейтинга.
+    names = [column.name for column in columns] + ["last_activity_at"]
+    now = literal(datetime.now(timezone.utc), DateTime(timezone=True))
+    placeholder = pg_insert(UserSummary).values(user_id=user_id, last_activity_at=now)
+    await session.execute(placeholder.on_conflict_do_update(
+        index_elements=[UserSummary.user_id],
+        set_={"last_activity_at": placeholder.excluded.last_activity_at}
+    ))
+    statement = pg_insert(UserSummary).from_select(
+        ["user_id", *names],
+        select(literal(user_id, BigInteger), *columns, now).where(*where)
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[UserSummary.user_id],
+        set_={name: statement.excluded[name] for name in names}
+    ).returning(UserSummary.completed, UserSummary.avg_percent)
+    result = await session.execute(statement)
+    return tuple(result.one())
+
+async def _refresh_summary_progress(session: AsyncSession, user_id: int) -> Tuple[int, Decimal]:
+    completed = func.count(UserProgress.id).label("completed")
+    return await _refresh_user_summary(session, user_id, [completed], UserProgress.user_id == user_id)
+
+async def _refresh_summary_scores(session: AsyncSession, user_id: int) -> Tuple[int, Decimal]:
+    return await _refresh_user_summary(session, user_id, user_score_aggregates(), UserTestScore.user_id == user_id)
+
+async def get_user_summary(session: AsyncSession, user_id: int) -> Optional[UserSummary]:
+    return await session.get(UserSummary, user_id)
+
+async def rebuild_user_summaries(session: AsyncSession) -> int:
+    # Полный пересчёт user_summary из user_progress и user_test_scores.
+    # Возвращает число строк, которые пришлось создать или исправить.
+    progress = (
+        select(UserProgress.user_id, func.count(UserProgress.id).label("completed"))
+        .group_by(UserProgress.user_id)
+        .subquery()
+    )
+    scores = (
+        select(UserTestScore.user_id, *user_score_aggregates(), func.max(UserTestScore.updated_at).label("last_activity_at"))
+        .group_by(UserTestScore.user_id)
+        .subquery()
+    )
+    source = (
+        select(
+            User.id,
+            *(func.coalesce((progress if name == "completed" else scores).c[name], 0) for name in SUMMARY_COLUMNS),
+            scores.c.last_activity_at,
+        )
+        .outerjoin(progress, progress.c.user_id == User.id)
+        .outerjoin(scores, scores.c.user_id == User.id)
+    )
+    statement = pg_insert(UserSummary).from_select(["user_id", *SUMMARY_COLUMNS, "last_activity_at"], source)
+    statement = statement.on_conflict_do_update(
+        index_elements=[UserSummary.user_id],
+        set_={
+            **{name: statement.excluded[name] for name in SUMMARY_COLUMNS},
+            "last_activity_at": func.greatest(UserSummary.last_activity_at, statement.excluded.last_activity_at),
+        },
+        where=tuple_(*(UserSummary.__table__.c[name] for name in SUMMARY_COLUMNS)).is_distinct_from(
+            tuple_(*(statement.excluded[name] for name in SUMMARY_COLUMNS))
+        )
+    )
+    result = await session.execute(statement)
+    # Рейтинг перечитает сводку при следующем обращении
+    await _commit(session, on_commit=[leaderboard.invalidate])
+    return result.rowcount
+
+def record_answer(user_id: int, question: QuestionSnapshot, chosen_option: int, latency_ms: Optional[int]):
+    # Не ждёт БД: событие уходит в очередь фоновой пакетной записи
+    answer_events_writer.add({
+        "user_id": user_id,
+        "question_id": question.id,
+        "lesson_code": question.lesson_code,
+        "chosen_option": chosen_option,
+        "is_correct": chosen_option == question.correct_option,
+        "question_version": question.version,
+        "latency_ms": latency_ms,
+        "created_at": datetime.now(timezone.utc),
+    })
+
+async def sync_progress_with_content(session: AsyncSession):
+    # Страховка к каскадам по внешним ключам: удаляем прогресс и результаты тестов
+    # для уроков, которых больше нет. Вызывается только фоновой сверкой после
+    # удаления контента, а не из пользовательских хендлеров.
+    lesson_exists = select(Lesson.code).where(Lesson.code == UserProgress.lesson_code).exists()
+    await session.execute(delete(UserProgress).where(~lesson_exists))
+    test_lesson_exists = select(Lesson.code).where(Lesson.code == UserTestScore.lesson_code).exists()
+    await session.execute(delete(UserTestScore).where(~test_lesson_exists))
+    # Каскадное удаление прогресса и результатов не обновляет сводку студентов
+    await rebuild_user_summaries(session)
+
+
+async def update_user(db_session, user, first_name: str, last_name: str):
+    try:
+        # Точка сохранения вместо полного отката: в режиме единицы работы
+        # откат не должен затронуть остальные изменения апдейта
+        async with db_session.begin_nested():
+            user.first_name = first_name
+            user.last_name = last_name
+        await _commit(db_session, partial(user_cache.invalidate, user.id))
+        logging.info(f"Updated user {user.id}: first_name={first_name}, last_name={last_name}")
+    except Exception as e:
+        logging.error(f"Error updating user {user.id}: {e}")
+        raise
+
+async def set_user_admin(session: AsyncSession, user_id: int) -> bool:
+    result = await session.execute(update(User).where(User.id == user_id).values(is_admin=True))
+    await _commit(session, partial(user_cache.invalidate, user_id))
+    return result.rowcount > 0
\ No newline at end of file
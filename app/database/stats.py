@@ -0,0 +1,204 @@
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Optional, Tuple, Union
+from sqlalchemy import select, func, tuple_, cast, Numeric
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.models import User, Lesson, TestQuestion, UserSummary, QuestionStats
+
+PAGE_SIZE = 10
+# Вопросы с меньшим числом ответов не попадают в рейтинг сложных: мало данных
+HARDEST_MIN_ATTEMPTS = 5
+
+
+@dataclass(frozen=True)
+class StatsOverview:
+    total_students: int
+    total_lessons: int
+    completed_lessons: int
+    avg_completion: float
+    avg_test_score: float
+
+
+async def get_stats_overview(session: AsyncSession) -> StatsOverview:
+    # Один запрос по сводке user_summary: студенты без тестов входят в среднее
+    # с нулём, как и раньше
+    result = await session.execute(
+        select(
+            func.count(User.id),
+            func.coalesce(func.sum(UserSummary.avg_percent), 0),
+            func.coalesce(func.sum(UserSummary.completed), 0),
+            select(func.count(Lesson.id)).scalar_subquery(),
+        )
+        .select_from(User)
+        .outerjoin(UserSummary, UserSummary.user_id == User.id)
+    )
+    total_students, score_sum, completed_lessons, total_lessons = result.one()
+    total_slots = total_students * total_lessons
+    return StatsOverview(
+        total_students=total_students,
+        total_lessons=total_lessons,
+        completed_lessons=completed_lessons,
+        avg_completion=round(completed_lessons / total_slots * 100, 2) if total_slots else 0,
+        avg_test_score=round(float(score_sum) / total_students, 2) if total_students else 0,
+    )
+
+
+@dataclass(frozen=True)
+class StudentRow:
+    id: int
+    first_name: str
+    last_name: str
+    username: str
+    completed: int
+    avg_percent: float
+    sort_value: Union[int, Decimal]
+
+
+@dataclass(frozen=True)
+class StudentPage:
+    students: Tuple[StudentRow, ...]
+    found: int
+    total_lessons: int
+    has_prev: bool
+    has_next: bool
+
+
+# Условия фильтров: (пройдено уроков, средний % тестов, всего уроков) -> WHERE
+STUDENT_FILTERS = {
+    "lessons_less_50": lambda completed, avg_percent, total: completed < total * 0.5,
+    "lessons_50_plus": lambda completed, avg_percent, total: completed >= total * 0.5,
+    "lessons_all": lambda completed, avg_percent, total: completed == total,
+    "tests_below_50": lambda completed, avg_percent, total: avg_percent < 50,
+    "tests_above_80": lambda completed, avg_percent, total: avg_percent > 80,
+}
+
+STUDENT_SORTS = ("id", "lessons", "tests")
+
+
+def parse_sort_value(sort: str, raw: str) -> Union[int, Decimal]:
+    return Decimal(raw) if sort == "tests" else int(raw)
+
+
+async def query_students(
+    session: AsyncSession,
+    filter_name: Optional[str] = None,
+    sort: str = "id",
+    cursor: Optional[Tuple[Union[int, Decimal], int]] = None,
+    backward: bool = False,
+    limit: int = PAGE_SIZE,
+) -> StudentPage:
+    # Фильтр, сортировка и keyset-пагинация выполняются одним SQL-запросом.
+    # cursor — (sort_value, user_id) крайней строки соседней страницы,
+    # backward=True листает к предыдущей странице.
+    # Все фильтры и сортировки — по узкой таблице user_summary, сортировки
+    # идут по индексам (completed, user_id) и (avg_percent, user_id)
+    completed = UserSummary.completed
+    avg_percent = UserSummary.avg_percent
+    total_lessons = select(func.count(Lesson.id)).scalar_subquery()
+
+    def students_query(*columns):
+        query = select(*columns).select_from(UserSummary).join(User, User.id == UserSummary.user_id)
+        if filter_name is not None:
+            query = query.where(STUDENT_FILTERS[filter_name](completed, avg_percent, total_lessons))
+        return query
+
+    if sort == "lessons":
+        sort_column, descending = completed, True
+    elif sort == "tests":
+        sort_column, descending = avg_percent, True
+    else:
+        sort_column, descending = UserSummary.user_id, False
+    key = tuple_(sort_column, UserSummary.user_id)
+
+    found = select(func.count()).select_from(students_query(User.id).subquery()).scalar_subquery()
+    query = students_query(
+        User.id, User.first_name, User.last_name, User.username,
+        completed.label("completed"), avg_percent.label("avg_percent"), sort_column.label("sort_value"),
+        total_lessons.label("total_lessons"), found.label("found"),
+    )
+    # Направление обхода: «вперёд» совпадает с порядком сортировки, «назад» — обратно ему
+    reverse = descending != backward
+    if cursor is not None:
+        query = query.where(key < tuple_(*cursor) if reverse else key > tuple_(*cursor))
+    if reverse:
+        query = query.order_by(sort_column.desc(), UserSummary.user_id.desc())
+    else:
+        query = query.order_by(sort_column, UserSummary.user_id)
+    rows = (await session.execute(query.limit(limit + 1))).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+    students = tuple(
+        StudentRow(
+            id=row.id, first_name=row.first_name, last_name=row.last_name, username=row.username,
+            completed=row.completed, avg_percent=float(row.avg_percent), sort_value=row.sort_value,
+        )
+        for row in rows
+    )
+    if rows:
+        found_count, lessons_count = rows[0].found, rows[0].total_lessons
+    else:
+        found_count, lessons_count = 0, 0
+    return StudentPage(
+        students=students,
+        found=found_count,
+        total_lessons=lessons_count,
+        has_prev=has_more if backward else cursor is not None,
+        has_next=cursor is not None if backward else has_more,
+    )
+
+
+@dataclass(frozen=True)
+class QuestionDifficulty:
+    question_id: int
+    lesson_code: str
+    position: int
+    question_text: str
+    correct_option: int
+    attempts: int
+    correct_percent: float
+    # Доля выборов каждого варианта в процентах
+    pick_percents: Tuple[float, float, float]
+
+
+def question_difficulty_query():
+    return (
+        select(TestQuestion.id, TestQuestion.lesson_code, TestQuestion.position, TestQuestion.question_text,
+               TestQuestion.correct_option, QuestionStats)
+        # Счётчики прежней версии вопроса (до правки вариантов) не показываются
+        .join(QuestionStats, (QuestionStats.question_id == TestQuestion.id) & (QuestionStats.version == TestQuestion.version))
+    )
+
+
+def to_question_difficulty(row) -> QuestionDifficulty:
+    stats = row.QuestionStats
+
+    def percent(count):
+        return round(count / stats.attempts * 100, 1) if stats.attempts else 0
+
+    return QuestionDifficulty(
+        question_id=row.id, lesson_code=row.lesson_code, position=row.position, question_text=row.question_text,
+        correct_option=row.correct_option, attempts=stats.attempts, correct_percent=percent(stats.correct),
+        pick_percents=(percent(stats.option_1_picks), percent(stats.option_2_picks), percent(stats.option_3_picks)),
+    )
+
+
+async def get_question_difficulty(session: AsyncSession, question_id: int) -> Optional[QuestionDifficulty]:
+    result = await session.execute(question_difficulty_query().where(TestQuestion.id == question_id))
+    row = result.first()
+    return to_question_difficulty(row) if row else None
+
+
+async def get_hardest_questions(
+    session: AsyncSession, limit: int = PAGE_SIZE, min_attempts: int = HARDEST_MIN_ATTEMPTS
+) -> Tuple[QuestionDifficulty, ...]:
+    # Читает только сводную таблицу question_stats, журнал ответов не сканируется
+    result = await session.execute(
+        question_difficulty_query()
+        .where(QuestionStats.attempts >= min_attempts)
+        .order_by(cast(QuestionStats.correct, Numeric) / QuestionStats.attempts, QuestionStats.attempts.desc(), TestQuestion.id)
+        .limit(limit)
+    )
+    return tuple(to_question_difficulty(row) for row in result)
@@ -0,0 +1,174 @@
+import asyncio
+import contextvars
+import logging
+from contextlib import suppress
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import select, delete, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from config import FSM_STORAGE, REDIS_URL, FSM_TTL, FSM_FLUSH_INTERVAL
+from app.database.models import AsyncSessionLocal, FsmRecord
+
+# Как часто удалять из fsm_records записи с истёкшим TTL, секунды
+PURGE_INTERVAL = 600
+
+
+class DatabaseStorage(BaseStorage):
+    # FSM-хранилище в общей БД: состояние переживает рестарт и доступно всем
+    # экземплярам бота. Записи копятся flush_interval секунд и сбрасываются
+    # пачкой upsert'ов; чтения сначала смотрят в ещё не сброшенные записи и в
+    # записи, сброс которых ещё не зафиксирован.
+    # Окно отложенной записи видно только своему процессу: другой экземпляр
+    # бота до сброса (до flush_interval секунд) читает из БД прежнее состояние.
+    # Поэтому в режиме вебхука, где экземпляров может быть несколько, по
+    # умолчанию flush_interval=0 и каждая запись сразу уходит в БД.
+    def __init__(
+        self,
+        session_pool: async_sessionmaker[AsyncSession],
+        ttl: int = FSM_TTL,
+        flush_interval: float = FSM_FLUSH_INTERVAL,
+        key_builder: Optional[KeyBuilder] = None,
+    ):
+        self.session_pool = session_pool
+        self.ttl = timedelta(seconds=ttl)
+        self.flush_interval = flush_interval
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        # Пачки, которые сейчас записываются в БД, от старых к новым
+        self._inflight: List[Dict[str, Dict[str, Any]]] = []
+        # Сбросы идут по очереди: более старая пачка не перезапишет в БД новую
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._write(self.key_builder.build(key), state=value)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record_key = self.key_builder.build(key)
+        pending = self._unflushed(record_key, "state")
+        if pending is not None:
+            return pending["state"]
+        record = await self._read(record_key)
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._write(self.key_builder.build(key), data=data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record_key = self.key_builder.build(key)
+        pending = self._unflushed(record_key, "data")
+        if pending is not None:
+            return pending["data"].copy()
+        record = await self._read(record_key)
+        return dict(record.data or {}) if record else {}
+
+    async def close(self) -> None:
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._flush_task
+        await self.flush()
+
+    def _unflushed(self, record_key: str, field: str) -> Optional[Dict[str, Any]]:
+        # Самая свежая ещё не зафиксированная в БД запись поля
+        for batch in (self._pending, *reversed(self._inflight)):
+            fields = batch.get(record_key)
+            if fields is not None and field in fields:
+                return fields
+        return None
+
+    async def _read(self, record_key: str) -> Optional[FsmRecord]:
+        # Отдельное короткое соединение, пока апдейт может держать своё, —
+        # поэтому UPDATE_CONCURRENCY ограничен половиной пула
+        async with self.session_pool() as session:
+            result = await session.execute(
+                select(FsmRecord).where(
+                    FsmRecord.key == record_key,
+                    or_(FsmRecord.expires_at.is_(None), FsmRecord.expires_at > datetime.now(timezone.utc))
+                )
+            )
+            return result.scalars().first()
+
+    async def _write(self, record_key: str, **fields):
+        self._pending.setdefault(record_key, {}).update(fields)
+        if self.flush_interval <= 0:
+            await self.flush()
+        elif self._flush_task is None or self._flush_task.done():
+            # Без контекста апдейта: сброс обслуживает записи многих апдейтов
+            self._flush_task = asyncio.create_task(self._flush_later(), context=contextvars.Context())
+
+    async def _flush_later(self):
+        while self._pending:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                # Ошибка уже залогирована, записи вернулись в очередь — повторим позже
+                await asyncio.sleep(1)
+
+    async def flush(self):
+        async with self._flush_lock:
+            await self._flush()
+
+    async def _flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        # До фиксации пачка остаётся видна чтениям, иначе они вернули бы из БД старую запись
+        self._inflight.append(pending)
+        now = datetime.now(timezone.utc)
+        expires_at = now + self.ttl
+        # Записи, менявшие одинаковый набор полей, уходят одним многострочным upsert'ом
+        groups: Dict[tuple, list] = {}
+        for record_key, fields in pending.items():
+            groups.setdefault(tuple(sorted(fields)), []).append({
+                "key": record_key,
+                "state": fields.get("state"),
+                "data": fields.get("data"),
+                "expires_at": expires_at,
+            })
+        try:
+            async with self.session_pool() as session:
+                for columns, rows in groups.items():
+                    statement = insert(FsmRecord).values(rows)
+                    statement = statement.on_conflict_do_update(
+                        index_elements=[FsmRecord.key],
+                        set_={
+                            **{column: statement.excluded[column] for column in columns},
+                            "expires_at": statement.excluded.expires_at,
+                        }
+                    )
+                    await session.execute(statement)
+                loop_time = asyncio.get_running_loop().time()
+                if loop_time - self._last_purge >= PURGE_INTERVAL:
+                    await session.execute(delete(FsmRecord).where(FsmRecord.expires_at < now))
+                    self._last_purge = loop_time
+                await session.commit()
+        except BaseException as e:
+            logging.error(f"Ошибка записи FSM в БД: {e!r}")
+            # Возвращаем несохранённое, не затирая записи, сделанные во время сброса
+            for record_key, fields in pending.items():
+                self._pending[record_key] = {**fields, **self._pending.get(record_key, {})}
+            raise
+        finally:
+            self._inflight = [batch for batch in self._inflight if batch is not pending]
+
+
+def create_fsm_storage(redis=None) -> BaseStorage:
+    # redis — готовый клиент (например, локальная замена сервера в тестах);
+    # без него подключаемся по REDIS_URL. Пакет redis нужен только в этом режиме.
+    if FSM_STORAGE == "redis":
+        from aiogram.fsm.storage.redis import RedisStorage
+        key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        if redis is not None:
+            return RedisStorage(redis, key_builder=key_builder, state_ttl=FSM_TTL, data_ttl=FSM_TTL)
+        return RedisStorage.from_url(REDIS_URL, key_builder=key_builder, state_ttl=FSM_TTL, data_ttl=FSM_TTL)
+    if FSM_STORAGE == "memory":
+        return MemoryStorage()
+    return DatabaseStorage(AsyncSessionLocal)
@@ -0,0 +1,119 @@
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import suppress
+from typing import AsyncIterator, Optional
+import aiofiles
+import aiofiles.os
+from aiogram import Bot
+from aiogram.types import PhotoSize
+from PIL import Image, ImageOps
+from config import IMAGE_MAX_SIDE, IMAGE_QUALITY, IMAGE_WORKERS
+
+CHUNK_SIZE = 65536
+DOWNLOAD_TIMEOUT = 30
+
+
+def normalize_image(src_path: str, dst_path: str, max_side: int, quality: int) -> str:
+    # Выполняется в дочернем процессе: декодирует картинку, поворачивает по EXIF,
+    # уменьшает до max_side по большей стороне и пересохраняет в JPEG без
+    # метаданных. Возвращает sha256 результата.
+    with Image.open(src_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        image.save(dst_path, "JPEG", quality=quality, optimize=True, progressive=True)
+    digest = hashlib.sha256()
+    with open(dst_path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaStorage:
+    # Хранилище картинок, загруженных админами. Файл стримится на диск без
+    # блокировки цикла событий и получает имя по sha256 содержимого: повторная
+    # загрузка того же фото не создаёт копию, а одновременные загрузки не
+    # перезаписывают друг друга. Возвращаемый ключ — путь вида ./img/<hash>.jpg,
+    # он хранится в колонках photo как есть.
+    # Перед сохранением картинка нормализуется в пуле процессов (workers=0 —
+    # сохранять как есть), и ключ считается уже по нормализованному файлу.
+    def __init__(
+        self,
+        root: str = "./img",
+        max_side: int = IMAGE_MAX_SIDE,
+        quality: int = IMAGE_QUALITY,
+        workers: int = IMAGE_WORKERS,
+    ):
+        self.root = root
+        self.max_side = max_side
+        self.quality = quality
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    async def save_photo(self, bot: Bot, photo: PhotoSize) -> str:
+        file = await bot.get_file(photo.file_id)
+        await aiofiles.os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        tmp_path = os.path.join(self.root, f".upload-{uuid.uuid4().hex}.part")
+        normalized_path = tmp_path + ".jpg"
+        try:
+            async with aiofiles.open(tmp_path, "wb") as f:
+                async for chunk in self._stream(bot, file.file_path):
+                    digest.update(chunk)
+                    await f.write(chunk)
+            hexdigest = await self._normalize(tmp_path, normalized_path)
+            if hexdigest is not None:
+                src_path = normalized_path
+            else:
+                src_path, hexdigest = tmp_path, digest.hexdigest()
+            key = f"{self.root}/{hexdigest}.jpg"
+            # Переименование атомарно: дубликат просто заменяет идентичный файл
+            await aiofiles.os.replace(src_path, key)
+        finally:
+            for path in (tmp_path, normalized_path):
+                with suppress(FileNotFoundError):
+                    await aiofiles.os.remove(path)
+        return key
+
+    async def _normalize(self, src_path: str, dst_path: str) -> Optional[str]:
+        if self.workers <= 0:
+            return None
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                self._executor, normalize_image, src_path, dst_path, self.max_side, self.quality
+            )
+        except Exception as e:
+            # Не картинка или повреждённый файл — сохраняем исходник
+            logging.warning(f"Image normalization failed, storing original: {e!r}")
+            return None
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _stream(self, bot: Bot, file_path: str) -> AsyncIterator[bytes]:
+        api = bot.session.api
+        if api.is_local:
+            async with aiofiles.open(api.wrap_local_file.to_local(file_path), "rb") as f:
+                while chunk := await f.read(CHUNK_SIZE):
+                    yield chunk
+        else:
+            async for chunk in bot.session.stream_content(
+                url=api.file_url(bot.token, file_path),
+                timeout=DOWNLOAD_TIMEOUT,
+                chunk_size=CHUNK_SIZE,
+                raise_for_status=True,
+            ):
+                yield chunk
+
+
+media_storage = MediaStorage()
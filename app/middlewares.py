@@ -1,19 +1,91 @@
-from aiogram import BaseMiddleware
-from aiogram.types import TelegramObject
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
-from typing import Callable, Dict, Any, Awaitable
-
-class DbSessionMiddleware(BaseMiddleware):
-    def __init__(self, session_pool: async_sessionmaker[AsyncSession]):
-        super().__init__()
-        self.session_pool = session_pool
-
-    async def __call__(
-        self,
-        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
-        event: TelegramObject,
-        data: Dict[str, Any],
-    ) -> Any:
-        async with self.session_pool() as session:
-            data["db_session"] = session
-            return await handler(event, data)
\ No newline at end of file
+import asyncio
+import logging
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from typing import Callable, Dict, Any, Awaitable, Optional
+from app.database.instrumentation import count_queries
+
+class LazySession:
+    # Прокси для AsyncSession: сессия создаётся и берёт соединение из пула только
+    # при первом обращении хендлера, апдейты без запросов к БД пул не трогают
+    def __init__(self, session_pool: async_sessionmaker[AsyncSession], unit_of_work: bool = False):
+        self._session_pool = session_pool
+        self._unit_of_work = unit_of_work
+        self._session: Optional[AsyncSession] = None
+
+    @property
+    def started(self) -> bool:
+        return self._session is not None
+
+    def __getattr__(self, name: str) -> Any:
+        if self._session is None:
+            self._session = self._session_pool()
+            self._session.info["unit_of_work"] = self._unit_of_work
+        return getattr(self._session, name)
+
+    async def finish(self, failed: bool = False):
+        # Одна фиксация (или откат) на весь апдейт
+        if self._session is None:
+            return
+        try:
+            if failed:
+                await self._session.rollback()
+            elif self._session.in_transaction():
+                await self._session.commit()
+        except Exception:
+            await self._session.rollback()
+            raise
+        else:
+            if not failed:
+                for callback in self._session.info.pop("on_commit", []):
+                    callback()
+        finally:
+            # Сброс кэшей, отложенный хелперами до конца транзакции
+            for invalidate in self._session.info.pop("after_commit", []):
+                invalidate()
+            self._session.info.pop("on_commit", None)
+            await self._session.close()
+
+class DbSessionMiddleware(BaseMiddleware):
+    # unit_of_work=True: хелперы из app.database.requests только делают flush,
+    # а все изменения апдейта фиксируются здесь одним коммитом
+    def __init__(self, session_pool: async_sessionmaker[AsyncSession], unit_of_work: bool = True):
+        super().__init__()
+        self.session_pool = session_pool
+        self.unit_of_work = unit_of_work
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        session = LazySession(self.session_pool, self.unit_of_work)
+        data["db_session"] = session
+        with count_queries() as counter:
+            try:
+                result = await handler(event, data)
+            except BaseException:
+                await session.finish(failed=True)
+                raise
+            await session.finish()
+        if session.started:
+            logging.debug(f"Update handled: {counter.count} queries, {counter.elapsed * 1000:.1f} ms in DB")
+        return result
+
+class ConcurrencyLimitMiddleware(BaseMiddleware):
+    # Ограничивает число апдейтов, обрабатываемых одновременно: в режиме вебхука
+    # aiogram запускает отдельную задачу на каждый запрос без верхней границы
+    def __init__(self, limit: int):
+        super().__init__()
+        self.semaphore = asyncio.Semaphore(limit)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        async with self.semaphore:
+            return await handler(event, data)
@@ -1,61 +1,75 @@
-from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-from aiogram.utils.keyboard import InlineKeyboardBuilder
-from app.database.requests import get_all_modules, get_lessons_by_module, get_test_questions_by_lesson
-
-async def create_main_menu_dynamic(db_session):
-    modules = await get_all_modules(db_session)
-    builder = InlineKeyboardBuilder()
-    for module in modules:
-        builder.button(text=f"📘 {module.code.capitalize()} модуль", callback_data=f"show_module_{module.code}")
-    builder.adjust(1)
-    return builder.as_markup()
-
-async def create_module_kb(db_session, module_prefix):
-    lessons = await get_lessons_by_module(db_session, module_prefix)
-    lessons.sort(key=lambda x: int(x.code.split("-")[1]))
-    builder = InlineKeyboardBuilder()
-    for lesson in lessons:
-        lesson_num = lesson.code.split("-")[1]
-        builder.button(text=f"📚 Урок {lesson_num}", callback_data=f"{module_prefix}_lesson-{lesson_num}")
-    builder.adjust(2)
-    return builder.as_markup()
-
-async def create_lesson_kb(video_link, notes_link, module_prefix, lesson_num):
-    builder = InlineKeyboardBuilder()
-    builder.row(
-        InlineKeyboardButton(text='▶️ Смотреть видеоурок', url=video_link),
-        InlineKeyboardButton(text='📄 Читать конспект', url=notes_link)
-    )
-    builder.row(
-        InlineKeyboardButton(text='📝 Задание', callback_data=f'{module_prefix}_test-{lesson_num}')
-    )
-    builder.button(text='🔙 Назад', callback_data=f'module_menu_{module_prefix}')
-    builder.adjust(2)
-    return builder.as_markup()
-
-async def create_test_kb(db_session, module_prefix, lesson_num, question_idx):
-    test_key = f"{module_prefix}_test-{lesson_num}"
-    questions = await get_test_questions_by_lesson(db_session, f"{module_prefix}_lesson-{lesson_num}")
-    builder = InlineKeyboardBuilder()
-    options = [questions[question_idx].option_1, questions[question_idx].option_2]
-    if questions[question_idx].option_3:
-        options.append(questions[question_idx].option_3)
-    for i, option in enumerate(options, 1):
-        builder.button(text=f"❓ {option}", callback_data=f'{test_key}_answer-{i}')
-    builder.adjust(1)
-    builder.button(text='🔙 Вернуться к уроку', callback_data=f'{module_prefix}_lesson-{lesson_num}')
-    return builder.as_markup()
-
-async def create_retry_test_kb(module_prefix, lesson_num):
-    builder = InlineKeyboardBuilder()
-    builder.button(text="🔄 Повторить тест", callback_data=f"{module_prefix}_test-{lesson_num}")
-    builder.button(text="🔙 Вернуться к уроку", callback_data=f"{module_prefix}_lesson-{lesson_num}")
-    builder.adjust(2)
-    return builder.as_markup()
-
-async def create_update_confirmation_kb():
-    builder = InlineKeyboardBuilder()
-    builder.button(text="✏️ Обновить", callback_data="update_profile")
-    builder.button(text="❌ Отмена", callback_data="cancel_update")
-    builder.adjust(2)
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from app.database.cache import get_cached_modules, get_cached_lessons, get_cached_keyboard
+
+# Клавиатуры навигации строятся один раз после изменения контента
+# и дальше отдаются из кэша без запросов к БД
+
+async def _build_main_menu(db_session):
+    modules = await get_cached_modules(db_session)
+    builder = InlineKeyboardBuilder()
+    for module in modules:
+        builder.button(text=f"📘 {module.code.capitalize()} модуль", callback_data=f"show_module_{module.code}")
+    builder.adjust(1)
+    return builder.as_markup()
+
+async def create_main_menu_dynamic(db_session):
+    return await get_cached_keyboard("main_menu", _build_main_menu, db_session)
+
+async def _build_module_kb(db_session, module_prefix):
+    # Уроки уже упорядочены по position в запросе
+    lessons = await get_cached_lessons(db_session, module_prefix)
+    builder = InlineKeyboardBuilder()
+    for lesson in lessons:
+        builder.button(text=f"📚 Урок {lesson.position}", callback_data=lesson.code)
+    builder.adjust(2)
+    return builder.as_markup()
+
+async def create_module_kb(db_session, module_prefix):
+    return await get_cached_keyboard(("module", module_prefix), _build_module_kb, db_session, module_prefix)
+
+async def _build_lesson_kb(video_link, notes_link, module_prefix, lesson_num):
+    builder = InlineKeyboardBuilder()
+    builder.row(
+        InlineKeyboardButton(text='▶️ Смотреть видеоурок', url=video_link),
+        InlineKeyboardButton(text='📄 Читать конспект', url=notes_link)
+    )
+    builder.row(
+        InlineKeyboardButton(text='📝 Задание', callback_data=f'{module_prefix}_test-{lesson_num}')
+    )
+    builder.button(text='🔙 Назад', callback_data=f'module_menu_{module_prefix}')
+    builder.adjust(2)
+    return builder.as_markup()
+
+async def create_lesson_kb(video_link, notes_link, module_prefix, lesson_num):
+    # Клавиатура целиком определяется аргументами, они же и ключ
+    return await get_cached_keyboard(
+        ("lesson", module_prefix, str(lesson_num), video_link, notes_link),
+        _build_lesson_kb, video_link, notes_link, module_prefix, lesson_num
+    )
+
+async def create_test_kb(question, module_prefix, lesson_num):
+    test_key = f"{module_prefix}_test-{lesson_num}"
+    builder = InlineKeyboardBuilder()
+    options = [question.option_1, question.option_2]
+    if question.option_3:
+        options.append(question.option_3)
+    for i, option in enumerate(options, 1):
+        builder.button(text=f"❓ {option}", callback_data=f'{test_key}_answer-{i}')
+    builder.adjust(1)
+    builder.button(text='🔙 Вернуться к уроку', callback_data=f'{module_prefix}_lesson-{lesson_num}')
+    return builder.as_markup()
+
+async def create_retry_test_kb(module_prefix, lesson_num):
+    builder = InlineKeyboardBuilder()
+    builder.button(text="🔄 Повторить тест", callback_data=f"{module_prefix}_test-{lesson_num}")
+    builder.button(text="🔙 Вернуться к уроку", callback_data=f"{module_prefix}_lesson-{lesson_num}")
+    builder.adjust(2)
+    return builder.as_markup()
+
+async def create_update_confirmation_kb():
+    builder = InlineKeyboardBuilder()
+    builder.button(text="✏️ Обновить", callback_data="update_profile")
+    builder.button(text="❌ Отмена", callback_data="cancel_update")
+    builder.adjust(2)
     return builder.as_markup()
\ No newline at end of file
@@ -1 +1,86 @@
-
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TOKEN = os.getenv("TOKEN")
+DB_URL = os.getenv("DB_URL")
+ADMIN_SECRET_CODE = os.getenv("ADMIN_SECRET_CODE")
+
+# Получение апдейтов: "polling" или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# Без секрета вебхук принимал бы апдейты от кого угодно
+if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+    raise RuntimeError("WEBHOOK_SECRET must be set when BOT_MODE=webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# Сколько параллельных соединений Telegram открывает к вебхуку (1–100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# Отвечать методом прямо в HTTP-ответе вебхука вместо фоновой обработки
+WEBHOOK_REPLY_IN_RESPONSE = os.getenv("WEBHOOK_REPLY_IN_RESPONSE", "false").lower() == "true"
+
+# Хранилище FSM: "database" (таблица fsm_records), "redis" или "memory"
+FSM_STORAGE = os.getenv("FSM_STORAGE", "database")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Через сколько секунд без изменений состояние пользователя считается устаревшим
+FSM_TTL = int(os.getenv("FSM_TTL", str(7 * 24 * 3600)))
+# Окно в секундах, за которое записи FSM копятся и сбрасываются в БД одним запросом
+# (0 — запись сразу). Окно видно только своему процессу, а в режиме вебхука
+# апдейты одного чата могут попасть на разные экземпляры, поэтому там по
+# умолчанию запись синхронная
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "0" if BOT_MODE == "webhook" else "0.05"))
+
+# Сколько секунд пользователь и его роль живут в кэше процесса (0 — не кэшировать)
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+# Через сколько секунд кэш модулей, уроков, вопросов и клавиатур перечитывается
+# из БД — так правки админа на другом экземпляре бота доходят до этого
+CONTENT_CACHE_TTL = float(os.getenv("CONTENT_CACHE_TTL", "60"))
+
+# Логирование SQL: "off", "slow" (только запросы дольше DB_SLOW_QUERY_MS) или "all"
+DB_LOG_LEVEL = os.getenv("DB_LOG_LEVEL", "slow")
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+# Сбор статистики по нормализованным запросам (команда /dbstats)
+DB_QUERY_STATS = os.getenv("DB_QUERY_STATS", "true").lower() == "true"
+
+# Пул соединений с БД
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Соединения старше стольких секунд пересоздаются (-1 — никогда)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Соединения фоновых задач: два пакетных писателя истории, сброс FSM и сверка
+DB_BACKGROUND_CONNECTIONS = 4
+# Апдейт может держать два соединения сразу: свою сессию и короткую сессию
+# чтения или сброса FSM либо сохранения file_id. Если апдейтов больше половины
+# пула, при всплеске все соединения заняты апдейтами, ждущими второго, и каждый
+# стоит DB_POOL_TIMEOUT. Предел по умолчанию выводится из размера пула.
+UPDATE_CONCURRENCY_LIMIT = max(1, (DB_POOL_SIZE + DB_MAX_OVERFLOW - DB_BACKGROUND_CONNECTIONS) // 2)
+# Максимум одновременно обрабатываемых апдейтов в процессе (0 — без ограничения)
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", str(UPDATE_CONCURRENCY_LIMIT)))
+# Кэш подготовленных выражений asyncpg на соединение
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+# Работа через pgbouncer в режиме transaction: кэши выражений отключаются,
+# а имена подготовленных выражений делаются уникальными, чтобы не
+# пересекаться на общих серверных соединениях
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+
+# Нормализация загружаемых картинок: максимальная сторона в пикселях,
+# качество JPEG и число процессов (0 — сохранять как есть)
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1280"))
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+# Фоновая пакетная запись истории: размер пачки, максимальная задержка и длина очереди
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "200"))
+BATCH_INTERVAL_MS = int(os.getenv("BATCH_INTERVAL_MS", "500"))
+BATCH_QUEUE_SIZE = int(os.getenv("BATCH_QUEUE_SIZE", "10000"))
+
+# Как часто рейтинг студентов перечитывается из БД, секунды (изменения из этого
+# процесса попадают в него сразу)
+LEADERBOARD_REFRESH = float(os.getenv("LEADERBOARD_REFRESH", "300"))
@@ -1,29 +1,90 @@
-import asyncio
-import logging
-from aiogram import Bot, Dispatcher
-from config import TOKEN
-from app.user.handlers import router as user_router
-from app.admin.handlers import router as admin_router
-from app.middlewares import DbSessionMiddleware
-from app.database.models import AsyncSessionLocal
-
-bot = Bot(token=TOKEN)
-dp = Dispatcher()
-
-async def main():
-    try:
-        dp.include_router(admin_router)
-        dp.include_router(user_router)
-        dp.update.middleware(DbSessionMiddleware(session_pool=AsyncSessionLocal))
-        await dp.start_polling(bot)
-    except Exception as e:
-        logging.error(f"Ошибка при запуске бота: {e}")
-
-if __name__ == '__main__':
-    logging.basicConfig(level=logging.INFO)
-    try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        print('Exit')
-    except Exception as e:
+import asyncio
+import logging
+import signal
+from contextlib import suppress
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from config import TOKEN, BOT_MODE, UPDATE_CONCURRENCY, UPDATE_CONCURRENCY_LIMIT, WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_MAX_CONNECTIONS, WEBHOOK_REPLY_IN_RESPONSE
+from app.user.handlers import router as user_router
+from app.admin.handlers import router as admin_router
+from app.middlewares import DbSessionMiddleware, ConcurrencyLimitMiddleware
+from app.fsm_storage import create_fsm_storage
+from app.database.models import AsyncSessionLocal, engine
+from app.database.migrations import run_migrations
+from app.database.maintenance import warm_up
+from app.media import media_storage
+from app.database.batch import close_writers
+
+bot = Bot(token=TOKEN)
+dp = Dispatcher(storage=create_fsm_storage())
+
+async def on_webhook_startup(bot: Bot):
+    await bot.set_webhook(
+        f"{WEBHOOK_BASE_URL}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=dp.resolve_used_update_types()
+    )
+
+async def run_webhook():
+    if UPDATE_CONCURRENCY:
+        dp.update.outer_middleware(ConcurrencyLimitMiddleware(UPDATE_CONCURRENCY))
+    dp.startup.register(on_webhook_startup)
+    app = web.Application()
+    # Заголовок X-Telegram-Bot-Api-Secret-Token сверяется с WEBHOOK_SECRET,
+    # чужие запросы получают 401
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET,
+        handle_in_background=not WEBHOOK_REPLY_IN_RESPONSE
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+        logging.info(f"Webhook server listening on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+        # docker stop присылает SIGTERM: выходим штатно, чтобы cleanup запустил
+        # dp.shutdown и несохранённые записи FSM и очереди истории дописались
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            with suppress(NotImplementedError):
+                loop.add_signal_handler(sig, stop.set)
+        await stop.wait()
+        logging.info("Stopping webhook server")
+    finally:
+        await runner.cleanup()
+
+async def main():
+    if not UPDATE_CONCURRENCY or UPDATE_CONCURRENCY > UPDATE_CONCURRENCY_LIMIT:
+        logging.warning(
+            f"UPDATE_CONCURRENCY={UPDATE_CONCURRENCY} exceeds {UPDATE_CONCURRENCY_LIMIT} for this DB pool: "
+            "a burst of updates can exhaust the pool and stall for DB_POOL_TIMEOUT"
+        )
+    try:
+        await run_migrations(engine)
+        await warm_up()
+        dp.include_router(admin_router)
+        dp.include_router(user_router)
+        dp.update.middleware(DbSessionMiddleware(session_pool=AsyncSessionLocal))
+        dp.shutdown.register(media_storage.close)
+        dp.shutdown.register(close_writers)
+        if BOT_MODE == "webhook":
+            await run_webhook()
+        else:
+            await bot.delete_webhook()
+            await dp.start_polling(bot, tasks_concurrency_limit=UPDATE_CONCURRENCY or None)
+    except Exception as e:
+        logging.error(f"Ошибка при запуске бота: {e}")
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print('Exit')
+    except Exception as e:
         logging.error(f"Необработанная ошибка: {e}")
\ No newline at end of file
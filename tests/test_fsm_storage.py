@@ -0,0 +1,151 @@
+import os
+
+# Нужен настоящий Postgres (DB_URL); без него тесты хранилища в БД пропускаются
+os.environ.setdefault("DB_URL", "postgresql+asyncpg://bot@localhost/bot")
+
+import asyncio
+import random
+from unittest.mock import MagicMock
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import delete, text
+from sqlalchemy.exc import SQLAlchemyError
+import app.fsm_storage as fsm_storage
+from app.fsm_storage import DatabaseStorage, create_fsm_storage
+from app.database.models import engine, AsyncSessionLocal, Base, FsmRecord
+
+# Отрицательный bot_id не пересекается с записями настоящего бота
+BOT_ID = -random.randint(1, 10 ** 9)
+
+
+def storage_key(chat_id: int = 1) -> StorageKey:
+    return StorageKey(bot_id=BOT_ID, chat_id=chat_id, user_id=chat_id)
+
+
+def run(check):
+    async def main():
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+        except (OSError, SQLAlchemyError) as error:
+            await engine.dispose()
+            pytest.skip(f"Postgres is not available: {error}")
+        try:
+            await check()
+        finally:
+            async with AsyncSessionLocal() as session:
+                await session.execute(delete(FsmRecord).where(FsmRecord.key.like(f"fsm:{BOT_ID}:%")))
+                await session.commit()
+            await engine.dispose()
+
+    asyncio.run(main())
+
+
+def test_pending_writes_are_read_back_before_the_flush():
+    async def check():
+        storage = DatabaseStorage(AsyncSessionLocal, flush_interval=60)
+        await storage.set_state(storage_key(), "Quiz:answering")
+        await storage.set_data(storage_key(), {"question_idx": 2})
+        assert await storage.get_state(storage_key()) == "Quiz:answering"
+        assert await storage.get_data(storage_key()) == {"question_idx": 2}
+        # Другой экземпляр бота до сброса ещё ничего не видит
+        assert await DatabaseStorage(AsyncSessionLocal).get_state(storage_key()) is None
+        await storage.close()
+        other = DatabaseStorage(AsyncSessionLocal)
+        assert await other.get_state(storage_key()) == "Quiz:answering"
+        assert await other.get_data(storage_key()) == {"question_idx": 2}
+
+    run(check)
+
+
+def test_batch_being_flushed_stays_visible():
+    async def check():
+        storage = DatabaseStorage(AsyncSessionLocal, flush_interval=60)
+        await storage.set_state(storage_key(), "Quiz:first")
+        await storage.flush()
+        record_key = storage.key_builder.build(storage_key())
+        # Блокировка строки из другой транзакции задерживает следующий сброс
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1 FROM fsm_records WHERE key = :key FOR UPDATE"), {"key": record_key})
+            await storage.set_state(storage_key(), "Quiz:second")
+            flush = asyncio.create_task(storage.flush())
+            await asyncio.sleep(0.2)
+            assert not flush.done() and storage._inflight
+            assert await storage.get_state(storage_key()) == "Quiz:second"
+            await conn.rollback()
+        await flush
+        assert not storage._inflight
+        assert await DatabaseStorage(AsyncSessionLocal).get_state(storage_key()) == "Quiz:second"
+
+    run(check)
+
+
+class FailingPool:
+    # Вместо session_pool: сессия «открывается», пока тест не разрешит, и падает
+    def __init__(self):
+        self.entered = asyncio.Event()
+        self.release = asyncio.Event()
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        self.entered.set()
+        await self.release.wait()
+        raise ConnectionError("database is down")
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+def test_failed_flush_requeues_without_losing_newer_writes():
+    async def check():
+        pool = FailingPool()
+        storage = DatabaseStorage(pool, flush_interval=60)
+        await storage.set_state(storage_key(1), "Quiz:old")
+        await storage.set_state(storage_key(2), "Quiz:other")
+        flush = asyncio.create_task(storage.flush())
+        await pool.entered.wait()
+        # Запись, сделанная во время неудачного сброса, важнее возвращённой в очередь
+        await storage.set_state(storage_key(1), "Quiz:new")
+        pool.release.set()
+        with pytest.raises(ConnectionError):
+            await flush
+        assert not storage._inflight
+        assert await storage.get_state(storage_key(1)) == "Quiz:new"
+        assert await storage.get_state(storage_key(2)) == "Quiz:other"
+        storage.session_pool = AsyncSessionLocal
+        await storage.flush()
+        other = DatabaseStorage(AsyncSessionLocal)
+        assert await other.get_state(storage_key(1)) == "Quiz:new"
+        assert await other.get_state(storage_key(2)) == "Quiz:other"
+
+    run(check)
+
+
+def test_expired_records_are_not_read():
+    async def check():
+        storage = DatabaseStorage(AsyncSessionLocal, ttl=0, flush_interval=0)
+        await storage.set_state(storage_key(), "Quiz:answering")
+        await asyncio.sleep(0.01)
+        assert await storage.get_state(storage_key()) is None
+        assert await storage.get_data(storage_key()) == {}
+
+    run(check)
+
+
+def test_create_fsm_storage_backends(monkeypatch):
+    monkeypatch.setattr(fsm_storage, "FSM_STORAGE", "memory")
+    assert isinstance(create_fsm_storage(), MemoryStorage)
+    monkeypatch.setattr(fsm_storage, "FSM_STORAGE", "database")
+    assert isinstance(create_fsm_storage(), DatabaseStorage)
+
+
+def test_create_fsm_storage_redis(monkeypatch):
+    pytest.importorskip("redis")
+    from aiogram.fsm.storage.redis import RedisStorage
+    monkeypatch.setattr(fsm_storage, "FSM_STORAGE", "redis")
+    storage = create_fsm_storage(redis=MagicMock())
+    assert isinstance(storage, RedisStorage)
+    assert storage.state_ttl == storage.data_ttl == fsm_storage.FSM_TTL
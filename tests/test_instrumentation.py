@@ -0,0 +1,40 @@
+import os
+
+# Движок создаётся при импорте моделей, но к БД не подключается
+os.environ.setdefault("DB_URL", "postgresql+asyncpg://bot@localhost/bot")
+
+from datetime import datetime, timezone
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from app.database.models import engine, User, FsmRecord
+from app.database.instrumentation import fingerprint
+
+
+def compiled(statement) -> str:
+    # Тот же SQL, что уходит в курсор asyncpg: $1::BIGINT и т. п.
+    return str(statement.compile(dialect=engine.dialect, compile_kwargs={"render_postcompile": True}))
+
+
+def fsm_upsert(rows: int) -> str:
+    now = datetime.now(timezone.utc)
+    return compiled(insert(FsmRecord).values([
+        {"key": str(i), "state": None, "data": None, "expires_at": now} for i in range(rows)
+    ]))
+
+
+def test_in_lists_of_any_length_share_a_fingerprint():
+    two = compiled(select(User).where(User.id.in_([1, 2])))
+    five = compiled(select(User).where(User.id.in_([1, 2, 3, 4, 5])))
+    assert "$1::BIGINT" in two
+    assert fingerprint(two) == fingerprint(five)
+    assert "(?, ...)" in fingerprint(five)
+
+
+def test_multirow_values_share_a_fingerprint():
+    assert "::TIMESTAMP WITH TIME ZONE" in fsm_upsert(1)
+    assert fingerprint(fsm_upsert(2)) == fingerprint(fsm_upsert(7))
+    assert "::" not in fingerprint(fsm_upsert(2))
+
+
+def test_literals_are_replaced():
+    assert fingerprint("SELECT 1 FROM users WHERE first_name = 'O''Brien'") == "SELECT ? FROM users WHERE first_name = ?"
@@ -0,0 +1,108 @@
+import os
+
+# Нужен настоящий Postgres (DB_URL); без него тесты пропускаются
+os.environ.setdefault("DB_URL", "postgresql+asyncpg://bot@localhost/bot")
+
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+import pytest
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.models import engine, Base, User, Module, Lesson, UserProgress, UserTestScore, UserSummary
+from app.database.instrumentation import assert_max_queries
+from app.database.requests import get_all_users, UserLoad
+from app.database.stats import get_stats_overview, query_students
+from app.admin.handlers import show_stats_overview, show_filtered_stats, show_student_stats, STUDENT_VIEWS
+from app.admin.keyboards import create_student_selection_kb
+
+STUDENTS = 20
+LESSONS = 3
+ADMIN_ID = -1000
+
+
+def seed(session: AsyncSession):
+    # Отрицательные id не пересекаются с настоящими пользователями Telegram
+    module = Module(code="qc_module", text="")
+    lessons = [Lesson(code=f"qc_module_lesson-{i}", position=i, module=module) for i in range(1, LESSONS + 1)]
+    session.add_all([module, *lessons, User(id=ADMIN_ID, first_name="Admin", is_admin=True)])
+    for user_id in range(-1, -STUDENTS - 1, -1):
+        session.add(User(id=user_id, first_name=f"Student {user_id}"))
+        session.add(UserProgress(user_id=user_id, lesson_code=lessons[0].code))
+        session.add(UserTestScore(
+            user_id=user_id, test_code=lessons[0].code, lesson_code=lessons[0].code, score=2, total=3, best_score=2
+        ))
+        session.add(UserSummary(user_id=user_id, completed=1, tests=1, attempts=1, score_sum=2, avg_percent=66.67))
+
+
+def run(check):
+    # Каждый тест — в транзакции, которая откатывается в конце
+    async def main():
+        try:
+            conn = await engine.connect()
+        except (OSError, SQLAlchemyError) as error:
+            await engine.dispose()
+            pytest.skip(f"Postgres is not available: {error}")
+        try:
+            await conn.begin()
+            await conn.run_sync(Base.metadata.create_all)
+            session = AsyncSession(bind=conn, join_transaction_mode="create_savepoint", expire_on_commit=False)
+            seed(session)
+            await session.flush()
+            await check(session)
+        finally:
+            await conn.rollback()
+            await conn.close()
+            await engine.dispose()
+
+    asyncio.run(main())
+
+
+def fake_callback(data: str = ""):
+    message = SimpleNamespace(answer=AsyncMock(), edit_text=AsyncMock(), delete=AsyncMock())
+    return SimpleNamespace(data=data, from_user=SimpleNamespace(id=ADMIN_ID), message=message, answer=AsyncMock())
+
+
+def test_user_listing_query_count_does_not_grow_with_users():
+    async def check(session):
+        with assert_max_queries(1):
+            users = await get_all_users(session)
+        assert len(users) >= STUDENTS
+
+        with assert_max_queries(1):
+            users = await get_all_users(session, UserLoad.COUNTS)
+            students = [user for user in users if user.id < 0 and user.id != ADMIN_ID]
+            assert all(user.completed_count == 1 and user.test_count == 1 for user in students)
+
+        with assert_max_queries(3):
+            users = await get_all_users(session, UserLoad.RELATIONS)
+            students = [user for user in users if user.id < 0 and user.id != ADMIN_ID]
+            assert all(len(user.progress) == 1 and len(user.test_scores) == 1 for user in students)
+
+        with assert_max_queries(1):
+            await create_student_selection_kb(session)
+
+    run(check)
+
+
+def test_admin_stats_screens_query_count_does_not_grow_with_users():
+    async def check(session):
+        with assert_max_queries(1):
+            overview = await get_stats_overview(session)
+        assert overview.total_students >= STUDENTS
+
+        for view, (_, filter_name, sort) in STUDENT_VIEWS.items():
+            with assert_max_queries(1):
+                await query_students(session, filter_name, sort)
+
+        # Экраны целиком: сводка, страница списка и профиль студента с проверкой админа
+        with assert_max_queries(1):
+            await show_stats_overview(fake_callback().message, session)
+        with assert_max_queries(1):
+            await show_filtered_stats(fake_callback(), session, "sort_by_tests")
+        callback = fake_callback("student_-1")
+        with assert_max_queries(6):
+            await show_student_stats(callback, session)
+        assert "Пройдено уроков: 1/" in callback.message.edit_text.call_args.args[0]
+
+    run(check)